@@ -1,4 +1,14 @@
 # bot.py
+import time
+BOOT_T0 = time.perf_counter()
+BOOT_TIMES = []
+
+def boot_mark(phase):
+    """Record how long the boot phase that just finished took."""
+    now = time.perf_counter()
+    last = BOOT_TIMES[-1][2] if BOOT_TIMES else BOOT_T0
+    BOOT_TIMES.append((phase, now - last, now))
+
 import asyncio
 try:
     import uvloop
@@ -9,18 +19,42 @@ except Exception as e:
 import os
 import re
 import json
-import time
+import marshal
+try:
+    import audioop
+except ImportError:
+    # removed from the stdlib in Python 3.13; `pip install audioop-lts`
+    # restores it, without it crossfade falls back to gapless
+    audioop = None
+import collections
+import bisect
+import struct
+from types import SimpleNamespace
+import sys
+import fcntl
+import signal
+import sqlite3
+import threading
+import shutil
+import contextvars
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
 from dataclasses import dataclass
 from typing import Optional, List
 
 import discord
 from discord.ext import commands, tasks
-from yt_dlp import YoutubeDL
 from dotenv import load_dotenv
+import aiohttp
 from aiohttp import web
 import subprocess
 import asyncio
 import urllib.parse
+import urllib.request
+
+boot_mark("imports")
 
 API_PORT = 8810
 
@@ -30,13 +64,94 @@ TOKEN = os.getenv("DISCORD_TOKEN")
 if not TOKEN:
     raise SystemExit("ERROR: Put DISCORD_TOKEN=yourtoken inside .env")
 
+# ========= Sharding =========
+# SHARD_PROCESSES > 1 turns this process into a supervisor that re-runs
+# bot.py once per worker, each worker owning every Nth gateway shard.
+SHARD_PROCESSES = max(1, int(os.getenv("SHARD_PROCESSES", "1")))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT")) if os.getenv("SHARD_COUNT") else None
+SHARD_WORKER = int(os.getenv("SHARD_WORKER")) if os.getenv("SHARD_WORKER") else None
+WORKER_ID = SHARD_WORKER or 0
+IS_SUPERVISOR = SHARD_PROCESSES > 1 and SHARD_WORKER is None
+
+def fetch_recommended_shards():
+    req = urllib.request.Request(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={
+            "Authorization": f"Bot {TOKEN}",
+            "User-Agent": "DiscordBot (TalibanAudioBot, 1.0)"
+        }
+    )
+    with urllib.request.urlopen(req, timeout=10) as r:
+        return int(json.load(r)["shards"])
+
+def run_supervisor():
+    count = SHARD_COUNT
+    if not count:
+        try:
+            count = fetch_recommended_shards()
+        except Exception as e:
+            print(f"[shard] could not fetch recommended shard count: {e}")
+            count = 1
+    count = max(count, SHARD_PROCESSES)
+    print(f"[shard] {count} shards across {SHARD_PROCESSES} processes")
+
+    def spawn(worker):
+        env = dict(os.environ, SHARD_WORKER=str(worker), SHARD_COUNT=str(count))
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+
+    def stop(*_):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    procs = {w: spawn(w) for w in range(SHARD_PROCESSES)}
+    try:
+        while True:
+            time.sleep(5)
+            for w, proc in procs.items():
+                if proc.poll() is not None:
+                    print(f"[shard] worker {w} exited ({proc.returncode}), restarting")
+                    procs[w] = spawn(w)
+    finally:
+        for proc in procs.values():
+            proc.terminate()
+        for proc in procs.values():
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+if IS_SUPERVISOR:
+    run_supervisor()
+    raise SystemExit(0)
+
 # ========= Storage paths =========
 DOWNLOAD_DIR = os.path.expanduser("/home/manish4586/discord-music/music")
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+# yt-dlp downloads land here and are renamed into DOWNLOAD_DIR once complete
+PARTIAL_DIR = os.path.join(DOWNLOAD_DIR, ".partial")
+os.makedirs(PARTIAL_DIR, exist_ok=True)
+QUARANTINE_DIR = os.path.join(DOWNLOAD_DIR, ".quarantine")
+os.makedirs(QUARANTINE_DIR, exist_ok=True)
 
 DATA_DIR = os.path.expanduser("/home/manish4586/discord-music")
 os.makedirs(DATA_DIR, exist_ok=True)
-STATS_PATH = os.path.join(DATA_DIR, "stats.json")
+
+def stats_paths(worker):
+    # worker 0 keeps the original file names so single-process installs
+    # and existing stats.json files carry over untouched
+    suffix = f".shard{worker}" if worker else ""
+    return (
+        os.path.join(DATA_DIR, f"stats{suffix}.json"),
+        os.path.join(DATA_DIR, f"stats{suffix}.bin"),
+    )
+
+STATS_PATH, STATS_SNAPSHOT_PATH = stats_paths(WORKER_ID)
+STATS_SNAPSHOT_VERSION = 1
+
+LOCK_DIR = os.path.join(DATA_DIR, "locks")
+os.makedirs(LOCK_DIR, exist_ok=True)
+CATALOG_PATH = os.path.join(DATA_DIR, "catalog.db")
+INTEGRITY_PATH = os.path.join(DATA_DIR, "integrity.bin")
 
 CACHE_DIR = os.path.join(DATA_DIR, "cache")
 os.makedirs(CACHE_DIR, exist_ok=True)
@@ -47,11 +162,33 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.voice_states = True
 intents.members = True
-bot = commands.Bot(command_prefix=COMMAND_PREFIX, intents=intents, help_command=None)
+if SHARD_WORKER is not None:
+    bot = commands.AutoShardedBot(
+        command_prefix=COMMAND_PREFIX, intents=intents, help_command=None,
+        shard_count=SHARD_COUNT,
+        shard_ids=[i for i in range(SHARD_COUNT) if i % SHARD_PROCESSES == WORKER_ID]
+    )
+else:
+    bot = commands.AutoShardedBot(command_prefix=COMMAND_PREFIX, intents=intents, help_command=None)
 
 START_TIME = time.time()
 
+@bot.event
+async def setup_hook():
+    # systemd and the shard supervisor stop us with SIGTERM; close cleanly so
+    # bot.run() returns and the listening ledger gets flushed below it
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: spawn_bg(bot.close()))
+
 # ========= Helpers =========
+BACKGROUND_TASKS = set()
+
+def spawn_bg(coro):
+    """create_task that keeps a reference so the task isn't garbage collected."""
+    task = asyncio.create_task(coro)
+    BACKGROUND_TASKS.add(task)
+    task.add_done_callback(BACKGROUND_TASKS.discard)
+    return task
+
 def ui(title, desc="", color=0x5865F2):
     e = discord.Embed(title=title, description=desc, color=color)
     e.set_footer(text="🎵 TalibanAudioBot • Raspberry Pi 5")
@@ -75,6 +212,33 @@ def fmt_mmss(seconds):
     m, s = divmod(seconds, 60)
     return f"{m:02d}:{s:02d}"
 
+def fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def atomic_write(path, data):
+    """
+    Write to a temp file next to `path`, fsync, then rename over it, so a
+    crash leaves either the old file or the new one, never a torn one.
+    """
+    tmp = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+    with open(tmp, "wb" if isinstance(data, bytes) else "w") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    fsync_dir(os.path.dirname(path))
+
+def commit_file(src, dst):
+    """Durably move a finished file into place."""
+    with open(src, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(src, dst)
+    fsync_dir(os.path.dirname(dst))
+
 # ========= System info =========
 def get_uptime_sec():
     try:
@@ -120,11 +284,36 @@ def get_temp():
         return None
 
 # ========= Stats Storage (SAFE, FIXED) =========
-def load_stats():
+def load_stats_snapshot(json_path, snap_path):
+    """
+    Load the marshal snapshot written by save_stats.
+    Only trusted when it is at least as new as stats.json, so hand edits
+    to the JSON file still win.
+    """
+    try:
+        snap_mtime = os.path.getmtime(snap_path)
+        if os.path.exists(json_path) and os.path.getmtime(json_path) > snap_mtime:
+            return None
+        with open(snap_path, "rb") as f:
+            version, data = marshal.load(f)
+        if version != STATS_SNAPSHOT_VERSION or not isinstance(data, dict):
+            return None
+        return data
+    except:
+        return None
+
+def read_stats(json_path, snap_path):
+    """Returns (stats, came_from_snapshot)."""
+    # snapshot is already normalized, skip the JSON parse + dedupe pass
+    snap = load_stats_snapshot(json_path, snap_path)
+    if snap is not None:
+        return snap, True
+
     base = {"total_songs":0, "total_play_time":0.0, "users":{}, "songs":{}}
-    if os.path.exists(STATS_PATH):
+    if os.path.exists(json_path):
         try:
-            loaded = json.load(open(STATS_PATH, "r"))
+            with open(json_path, "r") as f:
+                loaded = json.load(f)
             if isinstance(loaded, dict):
                 base.update(loaded)
         except:
@@ -144,35 +333,584 @@ def load_stats():
             # remove duplicates & ensure ints
             entry["users"] = list(dict.fromkeys(int(x) for x in entry["users"]))
 
-    return base
+    return base, False
+
+def load_stats():
+    data, from_snapshot = read_stats(STATS_PATH, STATS_SNAPSHOT_PATH)
+    if not from_snapshot:
+        save_stats_snapshot(data)
+    return data
+
+def save_stats_snapshot(data):
+    try:
+        atomic_write(STATS_SNAPSHOT_PATH, marshal.dumps((STATS_SNAPSHOT_VERSION, data)))
+    except:
+        pass
 
 def save_stats(data):
-    json.dump(data, open(STATS_PATH, "w"), indent=2)
+    atomic_write(STATS_PATH, json.dumps(data, indent=2))
+    save_stats_snapshot(data)
 
 STORED = load_stats()
+boot_mark("stats")
+
+_AGGREGATE_CACHE = {"at": 0.0, "data": None, "pending": None}
+
+def merge_stats(local):
+    """Blocking; `local` (a private copy of STORED) merged with the other workers' files."""
+    merged = {"total_songs":0, "total_play_time":0.0, "users":{}, "songs":{}}
+    for w in range(SHARD_PROCESSES):
+        data = local if w == WORKER_ID else read_stats(*stats_paths(w))[0]
+        merged["total_songs"] += data.get("total_songs", 0)
+        merged["total_play_time"] += data.get("total_play_time", 0.0)
+        for uid, u in data["users"].items():
+            m = merged["users"].setdefault(uid, {"time":0,"songs":0})
+            m["time"] += u.get("time", 0)
+            m["songs"] += u.get("songs", 0)
+        for vid, song in data["songs"].items():
+            m = merged["songs"].setdefault(vid, {"title": song.get("title", "Unknown"), "plays": 0, "users": []})
+            m["plays"] += song.get("plays", 0)
+            m["last_played"] = max(m.get("last_played", 0), song.get("last_played", 0))
+            for uid in song["users"]:
+                if uid not in m["users"]:
+                    m["users"].append(uid)
+    return merged
+
+async def aggregate_stats(max_age=10):
+    """
+    STORED merged with every other shard worker's stats snapshot.
+    Single-process installs just get STORED back. The other workers' files
+    are read and merged in an executor (a stale snapshot means a full JSON
+    parse); concurrent callers share one refresh.
+    """
+    if SHARD_PROCESSES <= 1:
+        return STORED
+    if _AGGREGATE_CACHE["data"] is not None and time.time() - _AGGREGATE_CACHE["at"] < max_age:
+        return _AGGREGATE_CACHE["data"]
+
+    pending = _AGGREGATE_CACHE["pending"]
+    if pending is None:
+        local = marshal.loads(marshal.dumps(STORED))
+        pending = asyncio.get_event_loop().run_in_executor(None, merge_stats, local)
+        _AGGREGATE_CACHE["pending"] = pending
+    try:
+        merged = await asyncio.shield(pending)
+    finally:
+        if _AGGREGATE_CACHE["pending"] is pending and pending.done():
+            _AGGREGATE_CACHE["pending"] = None
+    _AGGREGATE_CACHE["at"] = time.time()
+    _AGGREGATE_CACHE["data"] = merged
+    return merged
+
+# stats change in memory on the event loop; flush_listening writes them out
+# once a minute from an executor (two fsynced files per save are far too
+# slow for the loop on an SD card)
+STATS_DIRTY = {"dirty": False}
+
+def mark_stats_dirty():
+    STATS_DIRTY["dirty"] = True
 
 def add_user_time(uid, sec):
     u = STORED["users"].setdefault(str(uid), {"time":0,"songs":0})
     u["time"] += sec
-    STORED["total_play_time"] += sec
-    save_stats(STORED)
+    mark_stats_dirty()
 
 def add_user_song(uid):
     u = STORED["users"].setdefault(str(uid), {"time":0,"songs":0})
     u["songs"] += 1
     STORED["total_songs"] += 1
-    save_stats(STORED)
+    mark_stats_dirty()
 
 def add_song_play(video_id: str, title: str, user_id: int):
     s = STORED["songs"].setdefault(video_id, {"title": title, "plays": 0, "users": []})
     s["title"] = title
     s["plays"] += 1
+    s["last_played"] = time.time()
     if user_id not in s["users"]:
         s["users"].append(user_id)
-    save_stats(STORED)
+    mark_stats_dirty()
+
+# ========= Shared cache catalog =========
+# a cached track is either full-quality m4a or, once it has gone cold, a
+# low-bitrate opus transcode (see Storage tiering)
+AUDIO_EXTS = (".m4a", ".opus")
+
+def audio_path(video_id):
+    for ext in AUDIO_EXTS:
+        path = os.path.join(DOWNLOAD_DIR, video_id + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+class download_lock:
+    """
+    Cross-process lock for one video id (flock on a file in LOCK_DIR).
+    Blocking, so only take it from an executor thread.
+    """
+    def __init__(self, video_id):
+        self.path = os.path.join(LOCK_DIR, f"{video_id}.lock")
+        self.f = None
+
+    def __enter__(self):
+        self.f = open(self.path, "a")
+        fcntl.flock(self.f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.f, fcntl.LOCK_UN)
+        self.f.close()
+
+def catalog_connect():
+    return sqlite3.connect(CATALOG_PATH, timeout=10)
+
+def catalog_init():
+    with closing(catalog_connect()) as db:
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            " id TEXT PRIMARY KEY, title TEXT, duration INTEGER,"
+            " webpage_url TEXT, thumbnail TEXT, updated REAL)"
+        )
+        db.commit()
+
+def catalog_get(video_id):
+    try:
+        with closing(catalog_connect()) as db:
+            row = db.execute(
+                "SELECT id, title, duration, webpage_url, thumbnail FROM tracks WHERE id = ?",
+                (video_id,)
+            ).fetchone()
+    except sqlite3.Error:
+        return None
+    if not row:
+        return None
+    return dict(zip(("id", "title", "duration", "webpage_url", "thumbnail"), row))
+
+def catalog_put(meta):
+    try:
+        with closing(catalog_connect()) as db:
+            db.execute(
+                "INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?)",
+                (meta["id"], meta.get("title"), meta.get("duration"),
+                 meta.get("webpage_url"), meta.get("thumbnail"), time.time())
+            )
+            db.commit()
+    except sqlite3.Error as e:
+        print(f"[catalog] write failed for {meta.get('id')}: {e}")
+
+def catalog_remove(video_id):
+    try:
+        with closing(catalog_connect()) as db:
+            db.execute("DELETE FROM tracks WHERE id = ?", (video_id,))
+            db.commit()
+    except sqlite3.Error:
+        pass
+
+catalog_init()
+
+# ========= Outbound scheduler =========
+# Every REST call we make on our own initiative goes through here, in three
+# classes. Interactive replies (what a user is waiting on) skip the queue and
+# go out at once. The queued classes share the workers by weight: playback
+# panels get PANEL_WEIGHT turns for every background (cosmetic) one, so
+# neither starves the other and no single slow reply stalls them. Queued
+# jobs with a `key` coalesce, so a newer edit of the same message replaces
+# the pending one, and jobs with a `ttl` are dropped once stale.
+#
+# There is no real 429 detection here (discord.py sleeps through rate limits
+# internally): a call slower than SLOW_CALL_HINT is *taken* as a likely 429
+# wait, and droppable background work is shed for SLOW_CALL_BACKOFF after it.
+INTERACTIVE, PANEL, BACKGROUND = 0, 1, 2
+OUTBOUND_WORKERS = 3
+PANEL_WEIGHT = 3
+SLOW_CALL_HINT = 1.5
+SLOW_CALL_BACKOFF = 10
+
+class OutboundJob:
+    __slots__ = ("priority", "factory", "key", "deadline", "futures")
+
+    def __init__(self, priority, factory, key, deadline, future):
+        self.priority = priority
+        self.factory = factory
+        self.key = key
+        self.deadline = deadline
+        self.futures = [future]
+
+def _consume_result(fut):
+    # fire-and-forget callers never look at the future
+    if not fut.cancelled():
+        fut.exception()
+
+class OutboundScheduler:
+    def __init__(self, workers=OUTBOUND_WORKERS):
+        self.workers = workers
+        self.tasks = []
+        self.queues = {PANEL: collections.deque(), BACKGROUND: collections.deque()}
+        self.ready = None       # counts queued jobs across both classes
+        self.panel_streak = 0
+        self.pending = {}
+        self.backoff_until = 0.0
+        self.sent = {INTERACTIVE: 0, PANEL: 0, BACKGROUND: 0}
+        self.dropped = 0
+        self.coalesced = 0
+
+    def start(self):
+        if self.tasks:
+            return
+        self.ready = asyncio.Semaphore(0)
+        self.tasks = [spawn_bg(self._worker()) for _ in range(self.workers)]
+
+    async def call(self, priority, factory, key=None, ttl=None):
+        """Run `factory()` (a coroutine function) in its class and return its result."""
+        self.start()
+        if priority != INTERACTIVE:
+            return await self.submit(priority, factory, key, ttl)
+        return await self._run(INTERACTIVE, factory)
+
+    def submit(self, priority, factory, key=None, ttl=None):
+        """Queue `factory()` without waiting. Resolves to None if dropped."""
+        self.start()
+        if priority == INTERACTIVE:
+            priority = PANEL    # queued work is never more urgent than a panel
+        fut = asyncio.get_event_loop().create_future()
+        fut.add_done_callback(_consume_result)
+        deadline = time.monotonic() + ttl if ttl else None
+
+        job = self.pending.get(key) if key is not None else None
+        if job is not None:
+            job.factory = factory
+            job.deadline = deadline
+            job.futures.append(fut)
+            self.coalesced += 1
+            return fut
+
+        job = OutboundJob(priority, factory, key, deadline, fut)
+        if key is not None:
+            self.pending[key] = job
+        self.queues[priority].append(job)
+        self.ready.release()
+        return fut
+
+    def _next_job(self):
+        panels, background = self.queues[PANEL], self.queues[BACKGROUND]
+        if background and (not panels or self.panel_streak >= PANEL_WEIGHT):
+            self.panel_streak = 0
+            return background.popleft()
+        self.panel_streak += 1
+        return panels.popleft()
+
+    async def _run(self, priority, factory):
+        t0 = time.monotonic()
+        try:
+            return await factory()
+        finally:
+            if time.monotonic() - t0 > SLOW_CALL_HINT:
+                self.backoff_until = time.monotonic() + SLOW_CALL_BACKOFF
+            self.sent[priority] += 1
+
+    async def _worker(self):
+        while True:
+            await self.ready.acquire()
+            job = self._next_job()
+            if job.key is not None and self.pending.get(job.key) is job:
+                del self.pending[job.key]
+
+            now = time.monotonic()
+            if job.deadline and (now > job.deadline or (job.priority == BACKGROUND and now < self.backoff_until)):
+                self.dropped += 1
+                for f in job.futures:
+                    if not f.done():
+                        f.set_result(None)
+                continue
+
+            try:
+                result = await self._run(job.priority, job.factory)
+            except Exception as e:
+                for f in job.futures:
+                    if not f.done():
+                        f.set_exception(e)
+            else:
+                for f in job.futures:
+                    if not f.done():
+                        f.set_result(result)
+
+    def stats(self):
+        return {
+            "queued": {"panel": len(self.queues[PANEL]), "background": len(self.queues[BACKGROUND])},
+            "sent": {"interactive": self.sent[INTERACTIVE], "panel": self.sent[PANEL], "background": self.sent[BACKGROUND]},
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            # heuristic: a recent call took over SLOW_CALL_HINT seconds
+            "slow_call_backoff": time.monotonic() < self.backoff_until
+        }
+
+OUTBOUND = OutboundScheduler()
+
+async def reply(ctx, *args, **kwargs):
+    """ctx.send for command replies, at interactive priority."""
+    return await OUTBOUND.call(INTERACTIVE, lambda: ctx.send(*args, **kwargs))
+
+def set_presence(name):
+    # only the latest presence matters, so pending updates coalesce
+    OUTBOUND.submit(
+        BACKGROUND,
+        lambda: bot.change_presence(activity=discord.Activity(type=discord.ActivityType.listening, name=name)),
+        key="presence", ttl=30
+    )
+
+# ========= Guild settings =========
+SETTINGS_PATH = os.path.join(DATA_DIR, "settings.json")
+
+def load_settings():
+    try:
+        with open(SETTINGS_PATH) as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+GUILD_SETTINGS = load_settings()
+
+def guild_setting(gid, key, default=None):
+    return GUILD_SETTINGS.get(str(gid), {}).get(key, default)
+
+def set_guild_setting(gid, key, value):
+    # shard workers share the file: re-read under a lock so one worker's
+    # write doesn't drop another's
+    with open(SETTINGS_PATH + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        GUILD_SETTINGS.update(load_settings())
+        GUILD_SETTINGS.setdefault(str(gid), {})[key] = value
+        atomic_write(SETTINGS_PATH, json.dumps(GUILD_SETTINGS))
+
+# ========= Status messages =========
+STATUS_LINGER = 2   # seconds a finished status stays up before it is deleted
+
+class StatusMessage:
+    """
+    Transient progress message that never blocks the caller. update() and
+    finish() only record the embed wanted; a background task sends or edits
+    the message, skipping embeds superseded in the meantime, then queues it
+    for a batched delete. Guilds with `quiet` set get nothing at all.
+    """
+    def __init__(self, ctx):
+        self.channel = ctx.channel
+        self.enabled = not (ctx.guild and guild_setting(ctx.guild.id, "quiet", False))
+        self.wanted = None
+        self.done = False
+        self.msg = None
+        self.task = None
+        self.dirty = asyncio.Event()
+
+    def update(self, embed):
+        if not self.enabled or self.done:
+            return
+        self.wanted = embed
+        self.dirty.set()
+        if self.task is None:
+            self.task = spawn_bg(self._run())
+
+    def finish(self, embed=None):
+        if embed is not None:
+            self.update(embed)
+        self.done = True
+        self.dirty.set()
+
+    async def _run(self):
+        shown = None
+        while True:
+            await self.dirty.wait()
+            self.dirty.clear()
+            embed = self.wanted
+            if embed is not shown:
+                try:
+                    if self.msg is None:
+                        self.msg = await OUTBOUND.call(
+                            BACKGROUND, lambda: self.channel.send(embed=embed), ttl=10)
+                    else:
+                        msg = self.msg
+                        await OUTBOUND.call(
+                            BACKGROUND, lambda: msg.edit(embed=embed), key=("edit", msg.id), ttl=10)
+                except discord.HTTPException:
+                    pass
+                shown = embed
+            if self.done and self.wanted is shown:
+                break
+
+        if self.msg:
+            await asyncio.sleep(STATUS_LINGER)
+            queue_delete(self.msg)
+
+pending_deletes = {}  # channel id -> (channel, [messages])
+
+def queue_delete(msg):
+    pending_deletes.setdefault(msg.channel.id, (msg.channel, []))[1].append(msg)
+
+async def delete_batch(channel, msgs):
+    if len(msgs) > 1 and hasattr(channel, "delete_messages"):
+        try:
+            for i in range(0, len(msgs), 100):
+                await channel.delete_messages(msgs[i:i + 100])
+            return
+        except discord.HTTPException:
+            # bulk delete needs Manage Messages; fall back to one by one
+            pass
+    for m in msgs:
+        try:
+            await m.delete()
+        except discord.HTTPException:
+            pass
+
+async def flush_pending_deletes():
+    batches = list(pending_deletes.values())
+    pending_deletes.clear()
+    for channel, msgs in batches:
+        OUTBOUND.submit(BACKGROUND, lambda channel=channel, msgs=msgs: delete_batch(channel, msgs))
+
+# ========= Request tracing =========
+# Every !play gets a trace: a tree of timed spans from the message arriving
+# to the first audio packet going out. Recent traces stay in a ring buffer
+# served at /api/traces; slow ones are appended to a JSON-lines log with
+# their full span tree.
+TRACE_BUFFER = 200
+TRACE_SLOW_MS = int(os.getenv("TRACE_SLOW_MS", 5000))
+SLOW_LOG_PATH = os.path.join(DATA_DIR, "slow_requests.log")
+TRACES = collections.deque(maxlen=TRACE_BUFFER)
+CURRENT_TRACE = contextvars.ContextVar("trace", default=None)
+CURRENT_SPAN = contextvars.ContextVar("span", default=None)
+_trace_ids = itertools.count(1)
+
+def _ms(sec):
+    return None if sec is None else round(sec * 1000, 1)
+
+class Trace:
+    def __init__(self, name, started=None, **attrs):
+        now = time.time()
+        self.id = f"{WORKER_ID}-{next(_trace_ids)}"
+        self.name = name
+        self.attrs = attrs
+        self.started = min(now, started or now)
+        # offsets are monotonic; `started` may lie before the trace object existed
+        self.t0 = time.monotonic() - (now - self.started)
+        self.ids = itertools.count(1)
+        self.spans = []     # [id, parent id, name, start, end, attrs]
+        self.end = None
+        self.status = "ok"
+
+    def begin(self, name, parent=None, start=None, **attrs):
+        now = time.monotonic() - self.t0
+        span = [next(self.ids), parent, name, now if start is None else start, None, attrs]
+        self.spans.append(span)
+        return span
+
+    def close(self, span, **attrs):
+        if span[4] is None:
+            span[4] = time.monotonic() - self.t0
+        span[5].update(attrs)
+
+    def finish(self, status=None):
+        """Idempotent; files the trace, and logs it if it was slow."""
+        if self.end is not None:
+            return
+        self.end = time.monotonic() - self.t0
+        if status:
+            self.status = status
+        for span in self.spans:
+            if span[4] is None:
+                span[4] = self.end
+                span[5]["unfinished"] = True
+        TRACES.append(self)
+        if _ms(self.end) >= TRACE_SLOW_MS:
+            print(f"[trace] slow {self.name} {self.id}: {_ms(self.end):.0f}ms")
+            asyncio.get_event_loop().run_in_executor(None, write_slow_log, self.to_dict())
+
+    def summary(self):
+        return {
+            "id": self.id, "name": self.name, "started": self.started,
+            "duration_ms": _ms(self.end), "status": self.status, **self.attrs
+        }
+
+    def to_dict(self):
+        nodes = {}
+        roots = []
+        for sid, parent, name, start, end, attrs in self.spans:
+            node = {"name": name, "start_ms": _ms(start),
+                    "duration_ms": None if end is None else _ms(end - start)}
+            if attrs:
+                node["attrs"] = dict(attrs)
+            node["children"] = []
+            nodes[sid] = node
+            (nodes[parent]["children"] if parent in nodes else roots).append(node)
+        return dict(self.summary(), spans=roots)
+
+def write_slow_log(record):
+    # one short line per append; shard workers can share the file
+    with open(SLOW_LOG_PATH, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+class trace_span:
+    """`with trace_span("download"):` times a block under the current trace, if any."""
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.trace = None
+
+    def __enter__(self):
+        trace = CURRENT_TRACE.get()
+        if trace is not None and trace.end is None:
+            self.trace = trace
+            self.span = trace.begin(self.name, CURRENT_SPAN.get(), **self.attrs)
+            self.token = CURRENT_SPAN.set(self.span[0])
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.trace is not None:
+            CURRENT_SPAN.reset(self.token)
+            self.trace.close(self.span, **({"error": str(exc) or exc_type.__name__} if exc_type else {}))
+        return False
+
+def run_traced(fn, *args):
+    """run_in_executor that carries the current trace into the worker thread."""
+    call = functools.partial(contextvars.copy_context().run, fn, *args)
+    return asyncio.get_event_loop().run_in_executor(None, call)
+
+def postprocessor_spans():
+    """yt-dlp postprocessor hook timing each postprocessor (the remux) as a span."""
+    running = {}
+
+    def hook(d):
+        trace = CURRENT_TRACE.get()
+        if trace is None or trace.end is not None:
+            return
+        name = d.get("postprocessor") or "postprocess"
+        name = "remux" if "Remux" in name else name.lower()
+        if d.get("status") == "started":
+            running[name] = trace.begin(name, CURRENT_SPAN.get())
+        elif d.get("status") == "finished" and name in running:
+            trace.close(running.pop(name))
+    return hook
+
+def first_packet_hook():
+    """
+    Callback for the audio thread that closes the current trace once the
+    first packet is read. None when there is no open trace.
+    """
+    trace = CURRENT_TRACE.get()
+    if trace is None or trace.end is not None:
+        return None
+    span = trace.begin("first_packet", CURRENT_SPAN.get())
+    loop = asyncio.get_event_loop()
+
+    def hook():
+        trace.close(span)
+        loop.call_soon_threadsafe(trace.finish)
+    return hook
 
 # ========= Track Model =========
-@dataclass
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+@dataclass(slots=True)
 class Track:
     url: str
     title: str
@@ -181,6 +919,518 @@ class Track:
     thumb: str
     requested_by_id: int
     duration: Optional[int]
+    play_id: int = 0
+
+    def __post_init__(self):
+        # the same song sits in many guilds' queues and histories; share one
+        # copy of each string instead of one per Track
+        self.url = _intern(self.url)
+        self.title = _intern(self.title)
+        self.video_id = _intern(self.video_id)
+        self.file = _intern(self.file)
+        self.thumb = _intern(self.thumb)
+
+# ========= Decoder pool =========
+# Idle ffmpeg processes, already exec'd and with their libraries loaded,
+# blocked reading a concat list from stdin. Starting a track writes
+# "file <path>" (+ "inpoint <offset>") down that pipe and closes it, which is
+# all that is left between a !play / !next and decoded PCM.
+DECODER_POOL_SIZE = 2   # warm idle decoders kept ready
+# decoders alive at once before the pool stops refilling and prewarm backs
+# off; starting a user's playback is never refused
+DECODER_POOL_MAX = int(os.getenv("DECODER_POOL_MAX", 64))
+
+DECODER_ARGS = [
+    "ffmpeg", "-hide_banner", "-loglevel", "error",
+    "-protocol_whitelist", "file,pipe", "-f", "concat", "-safe", "0", "-i", "pipe:0",
+    "-vn", "-f", "s16le", "-ar", "48000", "-ac", "2", "pipe:1"
+]
+
+class PooledPCMAudio(discord.AudioSource):
+    def __init__(self, pool, proc):
+        self.pool = pool
+        self.proc = proc
+
+    def read(self):
+        ret = self.proc.stdout.read(discord.opus.Encoder.FRAME_SIZE)
+        if len(ret) != discord.opus.Encoder.FRAME_SIZE:
+            return b""
+        return ret
+
+    def cleanup(self):
+        proc, self.proc = self.proc, None
+        if proc:
+            self.pool.release(proc)
+
+class FallbackPCMAudio(discord.FFmpegPCMAudio):
+    """A plain ffmpeg source that holds one of the pool's decoder slots."""
+    def __init__(self, pool, *args, **kwargs):
+        try:
+            super().__init__(*args, **kwargs)
+        except Exception:
+            pool.release_slot()
+            raise
+        self.pool = pool
+
+    def cleanup(self):
+        super().cleanup()
+        pool, self.pool = self.pool, None
+        if pool:
+            pool.release_slot()
+
+class DecodersBusy(commands.CommandError):
+    pass
+
+class DecoderPool:
+    def __init__(self, size, cap):
+        self.size = size
+        self.cap = cap
+        self.idle = collections.deque()
+        self.active = 0
+        self.lock = threading.Lock()
+        self.spawner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="decoders")
+
+    def refill(self):
+        """Blocking: top the idle set back up, within the cap."""
+        while True:
+            with self.lock:
+                if len(self.idle) >= self.size or len(self.idle) + self.active >= self.cap:
+                    return
+            try:
+                proc = subprocess.Popen(
+                    DECODER_ARGS, stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+                )
+            except OSError as e:
+                print(f"[decoders] spawn failed: {e}")
+                return
+            with self.lock:
+                self.idle.append(proc)
+
+    def schedule_refill(self):
+        self.spawner.submit(self.refill)
+
+    def acquire(self, path, offset=0):
+        """A PCM source for `path` from a warm decoder, or None if none is ready."""
+        proc = None
+        with self.lock:
+            while self.idle:
+                candidate = self.idle.popleft()
+                if candidate.poll() is None:
+                    proc = candidate
+                    break
+            if proc is not None:
+                self.active += 1
+        self.schedule_refill()
+        if proc is None:
+            return None
+
+        quoted = path.replace("'", "'\\''")
+        listing = f"file '{quoted}'\n"
+        if offset:
+            listing += f"inpoint {offset:.3f}\n"
+        try:
+            proc.stdin.write(listing.encode())
+            proc.stdin.close()
+        except OSError:
+            self.release(proc)
+            return None
+        return PooledPCMAudio(self, proc)
+
+    def reserve_slot(self, optional=False):
+        """
+        Count a fallback ffmpeg as active. Only optional decoders (prewarm)
+        are refused at the cap, with DecodersBusy.
+        """
+        with self.lock:
+            if optional and len(self.idle) + self.active >= self.cap:
+                raise DecodersBusy("Too many tracks are decoding right now, try again in a moment.")
+            self.active += 1
+
+    def release_slot(self):
+        with self.lock:
+            self.active -= 1
+        self.schedule_refill()
+
+    def release(self, proc):
+        try:
+            proc.kill()
+            proc.wait(timeout=5)
+            proc.stdout.close()
+        except Exception:
+            pass
+        self.release_slot()
+
+    def health_check(self):
+        """Drop idle decoders that died and replace them."""
+        with self.lock:
+            alive = [proc for proc in self.idle if proc.poll() is None]
+            dead = len(self.idle) - len(alive)
+            self.idle = collections.deque(alive)
+        if dead:
+            print(f"[decoders] replaced {dead} dead idle decoders")
+        self.refill()
+
+    def stats(self):
+        with self.lock:
+            return {"idle": len(self.idle), "active": self.active, "max": self.cap}
+
+DECODERS = DecoderPool(DECODER_POOL_SIZE, DECODER_POOL_MAX)
+
+# ========= Playback engine =========
+FRAME_SECONDS = 0.02    # discord.py pulls 20 ms PCM frames
+PREWARM_LEAD = 8        # open the next track this many seconds before the current one ends
+PREBUFFER_FRAMES = 50   # decoded frames buffered before a handoff (1 s)
+MAX_CROSSFADE = 12
+
+def track_file(track):
+    """The track's audio file, following it if it moved to another storage tier."""
+    if not os.path.exists(track.file):
+        path = audio_path(track.video_id)
+        if path:
+            track.file = _intern(path)
+    return track.file
+
+def open_source(track, pos=0, optional=False):
+    path = track_file(track)
+    source = DECODERS.acquire(path, pos)
+    if source is not None:
+        return source
+    # no warm decoder ready: fall back to a fresh ffmpeg, still within the cap
+    DECODERS.reserve_slot(optional)
+    return FallbackPCMAudio(
+        DECODERS, path,
+        before_options=f"-ss {pos:.3f}" if pos else None,
+        options="-vn"
+    )
+
+class PrebufferedSource(discord.AudioSource):
+    """Wraps a source and decodes its first frames ahead of time."""
+    def __init__(self, source, frames=PREBUFFER_FRAMES):
+        self.source = source
+        self.frames = frames
+        self.buffer = collections.deque()
+
+    def fill(self):
+        # blocking until ffmpeg has produced the frames, run in an executor
+        while len(self.buffer) < self.frames:
+            data = self.source.read()
+            if not data:
+                break
+            self.buffer.append(data)
+
+    def read(self):
+        if self.buffer:
+            return self.buffer.popleft()
+        return self.source.read()
+
+    def cleanup(self):
+        self.source.cleanup()
+
+class GaplessSource(discord.AudioSource):
+    """
+    One source per voice session. Plays `track` and, when it runs out,
+    switches to the pre-warmed next source inside the same read() call, so
+    the voice client never sees a gap. With `crossfade` set, the two tracks
+    are mixed over the last `crossfade` seconds of the current one.
+    """
+    def __init__(self, track, source, position=0):
+        self.track = track
+        self.source = source
+        # `source` may start mid-track (resume, restored session)
+        self.frames = int(position / FRAME_SECONDS)
+        self.next_track = None
+        self.next_source = None
+        self.next_frames = 0
+        self.crossfade = 0
+        self.handoffs = 0
+        self.started_at = time.time() - position
+        self.lock = threading.Lock()
+        # called once from the audio thread when the first packet is read
+        self.on_first_packet = None
+        # set by cleanup(); a dead engine takes no more sources, since
+        # nothing would ever clean them up
+        self.closed = False
+
+    def set_next(self, track, source, crossfade=0):
+        with self.lock:
+            if self.closed:
+                return False
+            if self.next_frames:
+                # already fading into the armed track, too late to swap it
+                return False
+            old = self.next_source
+            self.next_track = track
+            self.next_source = source
+            self.crossfade = crossfade
+        if old:
+            old.cleanup()
+        return True
+
+    def read(self):
+        with self.lock:
+            data = self.source.read()
+            if data:
+                self.frames += 1
+                if self.on_first_packet:
+                    hook, self.on_first_packet = self.on_first_packet, None
+                    hook()
+                if self.next_source and self.crossfade and audioop and self.track.duration:
+                    remaining = self.track.duration - self.frames * FRAME_SECONDS
+                    if remaining < self.crossfade:
+                        incoming = self.next_source.read()
+                        if incoming:
+                            self.next_frames += 1
+                            fade = max(0.0, remaining / self.crossfade)
+                            data = audioop.add(
+                                audioop.mul(data, 2, fade),
+                                audioop.mul(incoming, 2, 1.0 - fade),
+                                2
+                            )
+                return data
+
+            if self.next_source is None:
+                return b""
+
+            self.source.cleanup()
+            self.track, self.source = self.next_track, self.next_source
+            self.frames = self.next_frames
+            self.next_track = self.next_source = None
+            self.next_frames = 0
+            self.handoffs += 1
+            self.started_at = time.time() - self.frames * FRAME_SECONDS
+
+            data = self.source.read()
+            if data:
+                self.frames += 1
+            return data
+
+    def replace_current(self, source, position):
+        """Swap in a source for the same track opened at `position` (a seek)."""
+        with self.lock:
+            if self.closed:
+                return False
+            old, dropped = self.source, self.next_source
+            self.source = source
+            self.frames = int(position / FRAME_SECONDS)
+            # the armed next track may already be partly mixed in; prewarm re-arms it
+            self.next_track = self.next_source = None
+            self.next_frames = 0
+            self.started_at = time.time() - position
+        old.cleanup()
+        if dropped:
+            dropped.cleanup()
+        return True
+
+    def cleanup(self):
+        with self.lock:
+            self.closed = True
+            for src in (self.source, self.next_source):
+                if src:
+                    src.cleanup()
+            self.next_source = None
+
+# ========= Seek index =========
+# Packet time -> byte offset, sampled every SEEK_INDEX_STEP seconds and kept
+# in the track's sidecar JSON. A seek starts ffmpeg exactly on an indexed
+# packet (so progress stays exact) after asking the kernel to read the bytes
+# around it ahead of time, so slow SD card reads overlap ffmpeg startup.
+# Indexes are built in the background; a seek that finds none (new file, or
+# one moved to opus) seeks by time straight away instead of waiting for it.
+SEEK_INDEX_STEP = 1.0
+SEEK_WARM_BYTES = 1 << 20
+SEEK_INDEXER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="seekindex")
+_SEEK_INDEXING = set()
+_SEEK_INDEXING_LOCK = threading.Lock()
+
+def build_seek_index(path):
+    out = subprocess.run(
+        NICE + ["ffprobe", "-v", "error", "-select_streams", "a:0",
+         "-show_entries", "packet=pts_time,pos", "-of", "csv=p=0", path],
+        capture_output=True, text=True, timeout=300
+    )
+    points = []
+    next_t = 0.0
+    for line in out.stdout.splitlines():
+        t, _, pos = line.partition(",")
+        try:
+            t = float(t)
+            pos = int(pos)
+        except ValueError:
+            continue
+        if t >= next_t:
+            points.append([round(t, 3), pos])
+            next_t = t + SEEK_INDEX_STEP
+    return {"size": os.path.getsize(path), "points": points}
+
+def load_seek_index(track):
+    try:
+        with open(os.path.join(DOWNLOAD_DIR, f"{track.video_id}.json")) as f:
+            index = json.load(f).get("seek_index")
+        if index and index.get("size") == os.path.getsize(track.file):
+            return index
+    except (OSError, ValueError):
+        pass
+    return None
+
+def ensure_seek_index(track):
+    """Blocking; builds and stores the index the first time a file needs one."""
+    track_file(track)
+    index = load_seek_index(track)
+    if index is not None:
+        return index
+
+    index = build_seek_index(track.file)
+    meta_path = os.path.join(DOWNLOAD_DIR, f"{track.video_id}.json")
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = catalog_get(track.video_id) or {"id": track.video_id}
+    meta["seek_index"] = index
+    atomic_write(meta_path, json.dumps(meta))
+    return index
+
+def warm_seek_index(track):
+    try:
+        ensure_seek_index(track)
+    except Exception as e:
+        print(f"[seek] index for {track.video_id} failed: {e}")
+    finally:
+        with _SEEK_INDEXING_LOCK:
+            _SEEK_INDEXING.discard(track.video_id)
+
+def index_in_background(track):
+    """Queue an index build for `track` unless one is already pending."""
+    with _SEEK_INDEXING_LOCK:
+        if track.video_id in _SEEK_INDEXING:
+            return
+        _SEEK_INDEXING.add(track.video_id)
+    SEEK_INDEXER.submit(warm_seek_index, track)
+
+def seek_point(index, pos):
+    """(packet time, byte offset) of the last indexed packet at or before `pos`."""
+    points = index["points"] if index else None
+    if not points:
+        return pos, None
+    i = bisect.bisect_right(points, [pos, float("inf")]) - 1
+    t, offset = points[max(i, 0)]
+    return t, offset
+
+def warm_range(path, offset, length=SEEK_WARM_BYTES):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    except (OSError, AttributeError):
+        pass
+
+# ========= Autoplay =========
+# With autoplay on, a dry queue continues from a local model instead of a
+# search: what listeners here played right after the current track
+# (transitions), plus tracks shared by the same listeners (the user sets
+# in the stats). Only tracks already on disk are picked, so the hand-off
+# needs no network and gets prewarmed like any queued track.
+TRANSITIONS_PATH = os.path.join(DATA_DIR, f"transitions.shard{WORKER_ID}.bin" if WORKER_ID else "transitions.bin")
+AUTOPLAY_RECENT = 20        # skip anything this far back in the guild's history
+AUTOPLAY_FOLLOWERS = 50     # followers remembered per track
+AUTOPLAY_FALLBACK = 100     # most-played tracks tried when nothing related is cached
+TRANSITION_WEIGHT = 3.0
+LISTENER_WEIGHT = 1.0
+# requested_by_id of autoplay picks: nobody asked for them, so they are kept
+# out of request/play stats (and so out of this model's own inputs)
+AUTOPLAY_REQUESTER = 0
+
+def requested_line(track):
+    if track.requested_by_id == AUTOPLAY_REQUESTER:
+        return "🔁 Autoplay"
+    return f"Requested by <@{track.requested_by_id}>"
+
+class CoListen:
+    def __init__(self):
+        self.transitions = self.load()   # vid -> {next vid: count}
+        self.dirty = False
+        self.songs = {}                  # vid -> (plays, listener ids)
+        self.by_user = {}                # uid -> set of vids
+        self.popular = []
+
+    def load(self):
+        try:
+            with open(TRANSITIONS_PATH, "rb") as f:
+                return marshal.load(f)
+        except:
+            return {}
+
+    def snapshot(self):
+        """Serialized transitions if they changed, else None. Call on the event loop."""
+        if not self.dirty:
+            return None
+        self.dirty = False
+        return marshal.dumps(self.transitions)
+
+    def record(self, prev, nxt):
+        if prev == nxt:
+            return
+        follow = self.transitions.setdefault(prev, {})
+        follow[nxt] = follow.get(nxt, 0) + 1
+        if len(follow) > AUTOPLAY_FOLLOWERS:
+            del follow[min(follow, key=follow.get)]
+        self.dirty = True
+
+    @staticmethod
+    def copy_songs(stats):
+        """A private copy of the stats' songs; STORED keeps changing on the event loop."""
+        return {
+            vid: (song.get("plays", 0), tuple(song.get("users", ())))
+            for vid, song in stats["songs"].items()
+        }
+
+    def rebuild(self, songs):
+        """Blocking; re-derives the listener index from a copy_songs() copy."""
+        by_user = {}
+        for vid, (_, users) in songs.items():
+            for uid in users:
+                by_user.setdefault(uid, set()).add(vid)
+        popular = sorted(songs, key=lambda v: songs[v][0], reverse=True)
+        self.songs, self.by_user, self.popular = songs, by_user, popular[:AUTOPLAY_FALLBACK]
+
+    def scores(self, vid):
+        scores = {}
+        follow = self.transitions.get(vid)
+        if follow:
+            total = sum(follow.values())
+            for nxt, n in follow.items():
+                scores[nxt] = TRANSITION_WEIGHT * n / total
+
+        users = self.songs.get(vid, (0, ()))[1]
+        shared = collections.Counter()
+        for uid in users:
+            shared.update(self.by_user.get(uid, ()))
+        for other, n in shared.items():
+            # cosine over listener sets, so tracks everyone plays don't win everything
+            others = len(self.songs.get(other, (0, ()))[1]) or 1
+            scores[other] = scores.get(other, 0) + LISTENER_WEIGHT * n / (len(users) * others) ** 0.5
+        scores.pop(vid, None)
+        return scores
+
+    def recommend(self, vid, exclude):
+        """Catalog meta of the best cached track to follow `vid`, else None."""
+        scores = self.scores(vid)
+        for other in sorted(scores, key=scores.get, reverse=True):
+            if other not in exclude:
+                meta = cached_meta(other)
+                if meta:
+                    return meta
+        for other in self.popular:
+            if other not in exclude and other != vid:
+                meta = cached_meta(other)
+                if meta:
+                    return meta
+        return None
+
+COLISTEN = CoListen()
 
 # ========= Player =========
 class Player:
@@ -198,6 +1448,15 @@ class Player:
         self.last_paused_track = None
         self.last_paused_position = 0
         self.play_id = 0
+        self.last_active = time.monotonic()
+        self.engine = None
+        self.crossfade = 0
+        self.text_channel_id = None
+        # set when a session is restored after a restart
+        self.resume_pos = None
+        self.resume_paused = False
+        # (track it follows, picked track or None)
+        self.autoplay_next = None
 
     async def ensure_voice(self, ctx):
         if self.voice and self.voice.is_connected():
@@ -208,10 +1467,11 @@ class Player:
 
         ch = ctx.author.voice.channel
 
-        if not self.voice:
-            self.voice = await ch.connect(self_deaf=True)
-        elif self.voice.channel != ch:
-            await self.voice.move_to(ch)
+        with trace_span("voice_connect"):
+            if not self.voice:
+                self.voice = await ch.connect(self_deaf=True)
+            elif self.voice.channel != ch:
+                await self.voice.move_to(ch)
 
     def progress(self):
         if not self.current or self.start_t is None:
@@ -230,100 +1490,648 @@ class Player:
 
         return float(played)
 
+    def snapshot(self):
+        """(state, position) for the session journal, (None, None) when idle."""
+        if not self.current or not self.voice or not self.voice.is_connected():
+            return None, None
+        state = (
+            self.voice.channel.id, self.text_channel_id, self.repeat_mode, self.crossfade,
+            track_tuple(self.current),
+            tuple(track_tuple(t) for t in self.queue),
+            tuple(track_tuple(t) for t in self.history[-JOURNAL_HISTORY:])
+        )
+        pos = (self.current.video_id, int(self.progress()), self.voice.is_paused())
+        return state, pos
+
+    def peek_next(self):
+        """The track loop() will pick after the current one, without popping it."""
+        if self.repeat_mode == 1 and self.current:
+            return self.current
+        if self.queue:
+            return self.queue[0]
+        if self.repeat_mode == 2 and self.history:
+            return self.history[0]
+        if self.current and guild_setting(self.gid, "autoplay", False):
+            return self.autoplay_pick()
+        return None
+
+    def autoplay_pick(self):
+        """The autoplay track to follow the current one, chosen once per track."""
+        cur = self.current
+        if not self.autoplay_next or self.autoplay_next[0] is not cur:
+            exclude = {t.video_id for t in self.history[-AUTOPLAY_RECENT:]}
+            exclude.update(t.video_id for t in self.queue)
+            exclude.add(cur.video_id)
+            meta = COLISTEN.recommend(cur.video_id, exclude)
+            track = track_from_meta(meta, AUTOPLAY_REQUESTER) if meta else None
+            self.autoplay_next = (cur, track)
+        track = self.autoplay_next[1]
+        if track:
+            track.play_id = self.play_id
+        return track
+
+    async def prewarm(self):
+        """Open and pre-buffer the next track once the current one is close to ending."""
+        engine = self.engine
+        if not engine or not self.current:
+            return
+        nxt = self.peek_next()
+        if nxt is None or nxt.play_id != self.play_id:
+            return
+        if engine.next_track is nxt:
+            return
+        lead = max(PREWARM_LEAD, self.crossfade + 2)
+        if self.current.duration and self.current.duration - self.progress() > lead:
+            return
+
+        try:
+            source = PrebufferedSource(open_source(nxt, optional=True))
+        except DecodersBusy:
+            return  # retried on the next tick; the loop opens it itself if need be
+        handoffs = engine.handoffs
+        await asyncio.get_event_loop().run_in_executor(None, source.fill)
+        # skipped, left or finished while we were decoding
+        if (self.engine is not engine or engine.handoffs != handoffs
+                or not self.voice or not (self.voice.is_playing() or self.voice.is_paused())
+                or not engine.set_next(nxt, source, self.crossfade)):
+            source.cleanup()
+
+    async def seek(self, pos):
+        """Jump the current track to `pos` seconds. Returns the position actually used."""
+        engine = self.engine
+        if not engine or not self.current or not self.voice:
+            raise commands.CommandError("Nothing is playing.")
+        if not (self.voice.is_playing() or self.voice.is_paused()):
+            raise commands.CommandError("Nothing is playing.")
+
+        track = engine.track
+        if track.duration:
+            pos = min(pos, max(0, track.duration - 1))
+        pos = max(0, pos)
+
+        def prepare():
+            track_file(track)
+            index = load_seek_index(track)
+            if index is None:
+                index_in_background(track)
+            start, offset = seek_point(index, pos)
+            if offset is not None:
+                warm_range(track.file, offset)
+            source = PrebufferedSource(open_source(track, start))
+            source.fill()
+            return source, start
+
+        # the old position keeps playing until the new source is decoded
+        source, start = await asyncio.get_event_loop().run_in_executor(None, prepare)
+        if self.engine is not engine or engine.track is not track or not engine.replace_current(source, start):
+            source.cleanup()
+            raise commands.CommandError("Track changed while seeking.")
+
+        now = time.time()
+        self.start_t = now - start
+        self.paused_accum = 0
+        self.pause_t = now if self.voice.is_paused() else None
+        if self.pause_t:
+            self.last_paused_position = start
+        return start
+
+    def take_from_queue(self, track):
+        """Queue, history and stats bookkeeping, once `track` is actually playing."""
+        for i, t in enumerate(self.queue):
+            if t is track:
+                del self.queue[i]
+                break
+        prev, self.current = self.current, track
+        # learn from what listeners chose, not from autoplay's own picks
+        autoplayed = track.requested_by_id == AUTOPLAY_REQUESTER
+        if prev and not autoplayed:
+            COLISTEN.record(prev.video_id, track.video_id)
+        self.history.append(track)
+        del self.history[:-HISTORY_LIMIT]
+        if not autoplayed:
+            add_user_song(track.requested_by_id)
+            add_song_play(track.video_id, track.title, track.requested_by_id)
+
     async def loop(self, ctx):
         while True:
-            if self.repeat_mode == 1 and self.current:
+            # a queued track stays queued until its source has opened, so
+            # a failed start doesn't lose it
+            queued = False
+            if self.current and (self.repeat_mode == 1 or self.resume_pos is not None):
                 track = self.current
 
             elif self.queue:
-                track = self.queue.pop(0)
-                self.current = track
-                self.history.append(track)
-                add_user_song(track.requested_by_id)
-                add_song_play(track.video_id, track.title, track.requested_by_id)
+                track = self.queue[0]
+                queued = True
 
             elif self.repeat_mode == 2 and self.history:
                 self.queue = self.history.copy()
                 self.history = []
                 continue
 
+            elif self.current and guild_setting(self.gid, "autoplay", False) and self.autoplay_pick():
+                self.queue.append(self.autoplay_pick())
+                continue
+
             else:
                 break
 
-            self.start_t = time.time()
-            self.pause_t = None
-            self.paused_accum = 0
-
             await self.ensure_voice(ctx)
             if self.play_id != track.play_id:
                 return
-            self.voice.play(
-                discord.FFmpegPCMAudio(
-                    track.file
-                )
-            )
 
-            try:
-                await bot.change_presence(
-                    activity=discord.Activity(
-                        type=discord.ActivityType.listening,
-                        name=track.title
-                    )
-                )
-            except:
-                pass
+            engine = self.engine
+            active = self.voice.is_playing() or self.voice.is_paused()
+            if engine and active and engine.track is track:
+                # the engine already switched to this track without a gap
+                self.start_t = engine.started_at
+            else:
+                if active:
+                    self.voice.stop()
+                pos = self.resume_pos or 0
+                self.resume_pos = None
+                with trace_span("ffmpeg_start"):
+                    source = open_source(track, pos)
+                self.engine = engine = GaplessSource(track, source, pos)
+                engine.on_first_packet = first_packet_hook()
+                self.voice.play(engine)
+                self.start_t = time.time() - pos
+            if queued:
+                self.take_from_queue(track)
+            self.pause_t = None
+            self.paused_accum = 0
+            if self.resume_paused:
+                self.resume_paused = False
+                self.voice.pause()
+                self.pause_t = time.time()
+            LEDGER.sync(self)
+
+            set_presence(track.title)
 
             if self.panel:
-                try:
-                    await self.panel.delete()
-                except:
-                    pass
+                OUTBOUND.submit(BACKGROUND, self.panel.delete)
+                self.panel = None
 
             embed = ui(
                 "▶️ Now Playing",
-                f"**{track.title}**\nRequested by <@{track.requested_by_id}>"
+                f"**{track.title}**\n{requested_line(track)}"
             )
             embed.set_thumbnail(url=track.thumb)
-            self.panel = await ctx.send(embed=embed)
+            spawn_bg(self.send_panel(ctx, track, embed))
 
+            handoffs = engine.handoffs
             while self.voice and (self.voice.is_playing() or self.voice.is_paused()):
+                if engine.handoffs != handoffs:
+                    break
+                await self.prewarm()
                 await asyncio.sleep(0.5)
 
         if self.panel:
-            try:
-                finished_embed = ui(
-                    "⏹️ Playback Finished",
-                    "No more songs in the queue."
-                )
-                finished_embed.set_thumbnail(url=None)
-                await self.panel.edit(embed=finished_embed)
-            except:
-                pass
+            finished_embed = ui(
+                "⏹️ Playback Finished",
+                "No more songs in the queue."
+            )
+            finished_embed.set_thumbnail(url=None)
+            panel = self.panel
+            OUTBOUND.submit(PANEL, lambda: panel.edit(embed=finished_embed), key=("edit", panel.id))
 
         self.start_t = None
         self.pause_t = None
         self.paused_accum = 0
         self.current = None
         self.panel = None
+        self.engine = None
+        LEDGER.sync(self)
 
+        set_presence("YouTube Music")
+
+    async def send_panel(self, ctx, track, embed):
+        """Post the now-playing panel without holding up the playback loop."""
         try:
-            await bot.change_presence(
-                activity=discord.Activity(
-                    type=discord.ActivityType.listening,
-                    name="YouTube Music"
-                )
-            )
-        except:
-            pass
+            msg = await OUTBOUND.call(PANEL, lambda: ctx.send(embed=embed))
+        except discord.HTTPException:
+            return
+        if self.current is track and self.panel is None:
+            self.panel = msg
+        else:
+            # the track moved on while this was queued
+            OUTBOUND.submit(BACKGROUND, msg.delete)
+
 
+HISTORY_LIMIT = 200
+PLAYER_IDLE_TTL = 30 * 60
 
 players = {}
 def getp(g):
+    """Player for a guild, created on demand. Only for commands that change playback."""
     if g.id not in players:
         players[g.id] = Player(g.id)
-    return players[g.id]
+    p = players[g.id]
+    p.last_active = time.monotonic()
+    return p
+
+def peekp(g):
+    """Player for a guild if one exists; read-only commands must not create one."""
+    return players.get(g.id)
+
+def evict_idle_players():
+    now = time.monotonic()
+    for gid, p in list(players.items()):
+        if gid in RESTORE_PENDING:
+            continue
+        if p.current or p.queue or (p.voice and p.voice.is_connected()):
+            continue
+        if now - p.last_active > PLAYER_IDLE_TTL:
+            players.pop(gid, None)
+
+def track_memory(t):
+    return sys.getsizeof(t) + sum(
+        sys.getsizeof(v) for v in (t.url, t.title, t.video_id, t.file, t.thumb) if v
+    )
+
+def player_memory(p):
+    """Approximate bytes held by one guild's player (shared strings counted per guild)."""
+    seen = set()
+    total = sys.getsizeof(p) + sys.getsizeof(p.__dict__)
+    total += sys.getsizeof(p.queue) + sys.getsizeof(p.history)
+    for t in (p.current, p.last_paused_track, *p.queue, *p.history):
+        if t is not None and id(t) not in seen:
+            seen.add(id(t))
+            total += track_memory(t)
+    return total
+
+def memory_report():
+    rss = 0
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    guilds = {
+        str(gid): {"bytes": player_memory(p), "queue": len(p.queue), "history": len(p.history)}
+        for gid, p in players.items()
+    }
+    return {
+        "rss": rss,
+        "players": len(players),
+        "players_bytes": sum(g["bytes"] for g in guilds.values()),
+        "guilds": guilds
+    }
+
+# ========= Session journal =========
+# Append-only log of per-guild player state so a restart can pick sessions
+# back up. "state" records carry the channels, repeat mode and track lists
+# and are only written when those change; "pos" records carry the playback
+# position and are cheap enough to write every tick.
+JOURNAL_PATH = os.path.join(DATA_DIR, f"players.shard{WORKER_ID}.journal" if WORKER_ID else "players.journal")
+JOURNAL_MAX_BYTES = 1 << 20
+JOURNAL_HISTORY = 50
+RECORD_HEADER = struct.Struct("<I")
+
+def track_tuple(t):
+    return (t.url, t.title, t.video_id, t.file, t.thumb, t.requested_by_id, t.duration)
+
+class SessionJournal:
+    def __init__(self, path):
+        self.path = path
+        self.written = {}  # gid -> (state, pos) as last written
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Latest (state, pos) per guild. A torn record at the tail ends the replay."""
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return {}
+
+        sessions = {}
+        off = 0
+        while off + RECORD_HEADER.size <= len(data):
+            (n,) = RECORD_HEADER.unpack_from(data, off)
+            off += RECORD_HEADER.size
+            if off + n > len(data):
+                break
+            try:
+                kind, gid, payload = marshal.loads(data[off:off + n])
+            except (ValueError, EOFError, TypeError):
+                break
+            off += n
+            entry = sessions.setdefault(gid, [None, None])
+            if kind == "state":
+                entry[0] = payload
+                if payload is None:
+                    entry[1] = None
+            else:
+                entry[1] = payload
+        return {gid: (state, pos) for gid, (state, pos) in sessions.items() if state is not None}
+
+    def diff(self, gid, state, pos):
+        """Records needed to bring the journal up to date for one guild."""
+        with self.lock:
+            old_state, old_pos = self.written.get(gid, (None, None))
+            out = []
+            if state != old_state:
+                out.append(("state", gid, state))
+            if state is not None and pos != old_pos:
+                out.append(("pos", gid, pos))
+            if state is None:
+                self.written.pop(gid, None)
+            else:
+                self.written[gid] = (state, pos)
+            return out
+
+    @staticmethod
+    def encode(records):
+        blobs = [marshal.dumps(r) for r in records]
+        return b"".join(RECORD_HEADER.pack(len(b)) + b for b in blobs)
+
+    def append(self, records):
+        with self.lock:
+            with open(self.path, "ab") as f:
+                f.write(self.encode(records))
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.getsize(self.path) > JOURNAL_MAX_BYTES:
+                self._compact()
+
+    def compact(self):
+        with self.lock:
+            self._compact()
+
+    def _compact(self):
+        records = []
+        for gid, (state, pos) in self.written.items():
+            records.append(("state", gid, state))
+            if pos is not None:
+                records.append(("pos", gid, pos))
+        atomic_write(self.path, self.encode(records))
+
+JOURNAL = SessionJournal(JOURNAL_PATH)
+RESTORE_PENDING = set()
+
+class RestoredContext:
+    """Just enough of commands.Context for Player.loop to run a restored session."""
+    def __init__(self, channel, voice_channel):
+        self.channel = channel
+        self.author = SimpleNamespace(voice=SimpleNamespace(channel=voice_channel))
+
+    async def send(self, *args, **kwargs):
+        return await self.channel.send(*args, **kwargs)
+
+async def restore_player(gid, state, pos):
+    guild = bot.get_guild(gid)
+    if guild is None:
+        return False
+    voice_id, text_id, repeat_mode, crossfade, current, queue, history = state
+    vc = guild.get_channel(voice_id)
+    text = guild.get_channel(text_id) if text_id else None
+    if vc is None or text is None or not any(not m.bot for m in vc.members):
+        return False
+
+    # tracks evicted or quarantined while we were down are skipped
+    current = Track(*current) if audio_path(current[2]) else None
+    queue = [Track(*v) for v in queue if audio_path(v[2])]
+    history = [Track(*v) for v in history if audio_path(v[2])]
+    if current is None and not queue:
+        return False
+
+    p = getp(guild)
+    if p.current or p.queue:
+        return False
+
+    p.voice = guild.voice_client or await vc.connect(self_deaf=True)
+    p.play_id += 1
+    for t in [current, *queue, *history]:
+        if t:
+            t.play_id = p.play_id
+    for t in [current, *queue]:
+        if t:
+            index_in_background(t)
+    p.queue, p.history = queue, history
+    p.repeat_mode, p.crossfade = repeat_mode, crossfade
+    p.text_channel_id = text_id
+    if current:
+        p.current = current
+        if pos and pos[0] == current.video_id:
+            p.resume_pos, p.resume_paused = pos[1], pos[2]
+        else:
+            p.resume_pos = 0
+
+    spawn_bg(p.loop(RestoredContext(text, vc)))
+    return True
+
+async def restore_sessions():
+    loop = asyncio.get_event_loop()
+    sessions = await loop.run_in_executor(None, JOURNAL.load)
+    if not sessions:
+        return
+    RESTORE_PENDING.update(sessions)
+    with JOURNAL.lock:
+        JOURNAL.written.update(sessions)
+    await loop.run_in_executor(None, JOURNAL.compact)
+
+    restored = 0
+    for gid, (state, pos) in sessions.items():
+        try:
+            if await restore_player(gid, state, pos):
+                restored += 1
+        except Exception as e:
+            print(f"[journal] restoring guild {gid} failed: {e}")
+        finally:
+            RESTORE_PENDING.discard(gid)
+        # stagger rejoins so a restart doesn't hit the gateway all at once
+        await asyncio.sleep(1)
+    print(f"[journal] restored {restored}/{len(sessions)} sessions")
+
+# ========= Download QoS =========
+# Downloads share the Pi's link and CPU with the voice UDP streams of every
+# playing guild. Playback-blocking downloads always run flat out; prefetch
+# and background downloads get a share of whatever the measured traffic
+# leaves over, and are paused outright while the uplink is saturated or a
+# playback download is in flight. Throttling happens in the yt-dlp progress
+# hook, which sleeps the download thread between chunks.
+DL_PLAYBACK, DL_PREFETCH, DL_BACKGROUND = 0, 1, 2
+DL_CLASS_NAMES = {DL_PLAYBACK: "playback", DL_PREFETCH: "prefetch", DL_BACKGROUND: "background"}
+NET_DOWN_CAPACITY = int(os.getenv("NET_DOWN_CAPACITY", 4 * 1024 * 1024))  # bytes/s
+NET_UP_CAPACITY = int(os.getenv("NET_UP_CAPACITY", 1024 * 1024))          # bytes/s
+VOICE_STREAM_RATE = 16 * 1024   # reserved per playing voice connection, bytes/s
+UPLINK_PRESSURE = 0.8           # above this share of the uplink, voice is at risk
+QOS_MIN_RATE = 32 * 1024        # below this a throttled download is just paused
+# hard ceiling for background downloads (the cache warmer), bytes/s
+DL_BACKGROUND_MAX_RATE = int(os.getenv("DL_BACKGROUND_MAX_RATE", 512 * 1024))
+QOS_MAX_SLEEP = 1.0
+
+class DownloadQoS:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = {}          # job id -> [class, bytes downloaded, video id]
+        self.seq = 0
+        self.limits = {DL_PLAYBACK: None, DL_PREFETCH: None, DL_BACKGROUND: None}
+        self.last_net = None
+        self.own_bytes = 0      # bytes our downloads fetched since the last sample
+        self.rx_rate = 0
+        self.tx_rate = 0
+        self.voices = 0
+        # playback downloads running on other shard workers (same uplink)
+        self.remote_playback = 0
+        self.paused = {DL_PREFETCH: 0, DL_BACKGROUND: 0}
+
+    def active(self, cls):
+        return sum(1 for c, _, _ in self.jobs.values() if c == cls)
+
+    def promote(self, video_id):
+        """Someone is now waiting on `video_id`: run its download unthrottled."""
+        with self.lock:
+            self._promote(video_id)
+
+    def _promote(self, video_id):
+        for job in self.jobs.values():
+            if job[2] == video_id:
+                job[0] = DL_PLAYBACK
+
+    def sample(self, voices, remote_playback=0):
+        """Re-read the interface counters and recompute the per-class limits."""
+        now = time.monotonic()
+        rx, tx = _read_net()
+        last, self.last_net = self.last_net, (now, rx, tx)
+        self.voices = voices
+        self.remote_playback = remote_playback
+        if last is None or now <= last[0]:
+            return
+        dt = now - last[0]
+        self.rx_rate = max(0, rx - last[1]) / dt
+        self.tx_rate = max(0, tx - last[2]) / dt
+        with self.lock:
+            own, self.own_bytes = self.own_bytes, 0
+            playback = self.active(DL_PLAYBACK) + remote_playback
+
+        # what's left of the downlink once other traffic and voice headroom are taken out
+        foreign = max(0.0, self.rx_rate - own / dt)
+        spare = NET_DOWN_CAPACITY - foreign - voices * VOICE_STREAM_RATE
+        if voices and self.tx_rate > NET_UP_CAPACITY * UPLINK_PRESSURE:
+            prefetch = background = 0
+        elif playback:
+            prefetch, background = spare * 0.25, 0
+        elif voices:
+            prefetch, background = spare * 0.5, spare * 0.25
+        else:
+            prefetch, background = None, spare * 0.5
+
+        self.limits = {
+            DL_PLAYBACK: None,
+            DL_PREFETCH: prefetch if prefetch is None or prefetch >= QOS_MIN_RATE else 0,
+            DL_BACKGROUND: min(background, DL_BACKGROUND_MAX_RATE) if background >= QOS_MIN_RATE else 0,
+        }
+
+    def job_limit(self, cls):
+        """Bytes/s for one job of `cls`: the class budget split across its jobs."""
+        with self.lock:
+            if cls != DL_PLAYBACK and (self.active(DL_PLAYBACK) or self.remote_playback):
+                # a user is waiting on a download; don't wait for the next sample
+                if cls == DL_BACKGROUND:
+                    return 0
+            limit = self.limits.get(cls)
+            if not limit:
+                return limit
+            return limit / max(1, self.active(cls))
+
+    @contextmanager
+    def job(self, video_id, cls, cancel=None):
+        """
+        Register a download; yields the progress hook that enforces its limit.
+        Register before waiting on the video's download lock: a playback job
+        promotes whatever prefetch or background job holds that lock.
+        """
+        with self.lock:
+            self.seq += 1
+            job_id = self.seq
+            self.jobs[job_id] = [cls, 0, video_id]
+            if cls == DL_PLAYBACK:
+                self._promote(video_id)
+        state = {"t": time.monotonic(), "bytes": 0}
+
+        def hook(d):
+            if cancel is not None and cancel.is_set():
+                raise PrefetchCancelled(d.get("info_dict", {}).get("id"))
+            done = d.get("downloaded_bytes") or 0
+            with self.lock:
+                job = self.jobs[job_id]
+                delta = max(0, done - job[1])
+                job[1] = done
+                self.own_bytes += delta
+                cls = job[0]
+            if cls == DL_PLAYBACK or d.get("status") != "downloading":
+                return
+
+            # sleep in short slices until the bytes since the last checkpoint
+            # are paid for at the current limit; yt-dlp reads blocks of up
+            # to several MiB, so one block can owe many seconds
+            paused = False
+            while True:
+                if cancel is not None and cancel.is_set():
+                    raise PrefetchCancelled(d.get("info_dict", {}).get("id"))
+                # the class may have been promoted while we slept
+                cls = self.jobs[job_id][0]
+                if cls == DL_PLAYBACK:
+                    break
+                limit = self.job_limit(cls)
+                if limit is None:
+                    break
+                if limit == 0:
+                    if not paused:
+                        paused = True
+                        self.paused[cls] += 1
+                    time.sleep(QOS_MAX_SLEEP)
+                    # time spent paused pays for nothing
+                    state["t"] = time.monotonic()
+                    continue
+                owed = (done - state["bytes"]) / limit - (time.monotonic() - state["t"])
+                if owed < 0.01:
+                    break
+                time.sleep(min(owed, QOS_MAX_SLEEP))
+            # back on schedule
+            state["t"] = time.monotonic()
+            state["bytes"] = done
+
+        try:
+            yield hook
+        finally:
+            with self.lock:
+                self.jobs.pop(job_id, None)
+
+    def stats(self):
+        with self.lock:
+            active = {DL_CLASS_NAMES[c]: self.active(c) for c in DL_CLASS_NAMES}
+        return {
+            "active": active,
+            "limits": {DL_CLASS_NAMES[c]: (None if v is None else int(v)) for c, v in self.limits.items()},
+            "paused": {DL_CLASS_NAMES[c]: n for c, n in self.paused.items()},
+            "voices": self.voices,
+            "rx_rate": int(self.rx_rate),
+            "tx_rate": int(self.tx_rate),
+        }
+
+QOS = DownloadQoS()
 
 # ========= yt-dlp =========
+_YoutubeDL = None
+
+def ydl(opts):
+    """
+    yt-dlp takes a long time to import, so load it on first extraction
+    instead of at boot.
+    """
+    global _YoutubeDL
+    if _YoutubeDL is None:
+        t0 = time.perf_counter()
+        from yt_dlp import YoutubeDL
+        _YoutubeDL = YoutubeDL
+        print(f"[boot] yt-dlp loaded in {time.perf_counter() - t0:.2f}s")
+    return _YoutubeDL(opts)
+
 YDL_OPTS = {
     "format":"m4a/bestaudio/best",
     "quiet":True,
@@ -331,7 +2139,7 @@ YDL_OPTS = {
     "noplaylist":True,
     "restrictfilenames":True,
     "cachedir": CACHE_DIR,
-    "outtmpl": os.path.join(DOWNLOAD_DIR, "%(id)s.%(ext)s"),
+    "outtmpl": os.path.join(PARTIAL_DIR, "%(id)s.%(ext)s"),
     "postprocessors":[
         {
          "key": "FFmpegVideoRemuxer",
@@ -342,91 +2150,350 @@ YDL_OPTS = {
 YOUTUBE_URL_RE = re.compile("(youtube|youtu.be)")
 search_results = {}
 
-async def build_track(ctx, query, uid):
-    loop = asyncio.get_event_loop()
-
-    m = re.search(r"(v=|youtu.be/)([A-Za-z0-9_-]{6,20})", query)
-    video_id = m.group(2) if m else None
-
-    if video_id:
-        file = os.path.join(DOWNLOAD_DIR, f"{video_id}.m4a")
-        meta_path = os.path.join(DOWNLOAD_DIR, f"{video_id}.json")
-
-        if os.path.exists(file) and os.path.exists(meta_path):
-            info = json.load(open(meta_path))
-
-            title = info.get("title", "Unknown")
-            url = info.get("webpage_url")
-            duration = info.get("duration")
-            thumb = info.get("thumbnail")
-
-            return Track(url, title, video_id, file, thumb, uid, duration)
-
-    msg = await ctx.send(embed=ui("🔍 Fetching Audio...", f"**{query}**"))
-
-    def probe():
-        with YoutubeDL({"quiet": True, "skip_download": True}) as y:
-            return y.extract_info(query, download=False)
+def save_track_meta(meta):
+    path = os.path.join(DOWNLOAD_DIR, f"{meta['id']}.json")
+    if "seek_index" not in meta:
+        # keep an index built earlier for the same file
+        try:
+            with open(path) as f:
+                old = json.load(f)
+            if old.get("seek_index"):
+                meta = dict(meta, seek_index=old["seek_index"])
+        except (OSError, ValueError):
+            pass
+    atomic_write(path, json.dumps(meta))
+    catalog_put(meta)
 
-    info = await loop.run_in_executor(None, probe)
+def track_meta(info, fallback_url=None):
+    vid = info["id"]
+    return {
+        "id": vid,
+        "title": info.get("title", "Unknown"),
+        "duration": info.get("duration"),
+        "webpage_url": info.get("webpage_url", fallback_url),
+        "thumbnail": f"https://img.youtube.com/vi/{vid}/hqdefault.jpg"
+    }
 
-    if "entries" in info:
-        info = info["entries"][0]
+def track_from_meta(meta, uid):
+    track = Track(
+        meta.get("webpage_url"), meta.get("title", "Unknown"), meta["id"],
+        audio_path(meta["id"]) or os.path.join(DOWNLOAD_DIR, f"{meta['id']}.m4a"),
+        meta.get("thumbnail"), uid, meta.get("duration")
+    )
+    # build the seek index while the track plays, not on the first !seek
+    index_in_background(track)
+    return track
 
-    vid = info["id"]
-    title = info.get("title", "Unknown")
-    url = info.get("webpage_url", query)
-    file = os.path.join(DOWNLOAD_DIR, f"{vid}.m4a")
-    thumb = f"https://img.youtube.com/vi/{vid}/hqdefault.jpg"
-    duration = info.get("duration")
-    meta_path = os.path.join(DOWNLOAD_DIR, f"{vid}.json")
-
-    if os.path.exists(file):
-        s_meta = {
-            "id": vid,
-            "title": title,
-            "duration": duration,
-            "webpage_url": url,
-            "thumbnail": thumb
-        }
-        json.dump(s_meta, open(meta_path, "w"))
-        await msg.edit(embed=ui("🎶 Already Cached", f"**{title}** is ready."))
-        await asyncio.sleep(2)
-        await msg.delete()
-        return Track(url, title, vid, file, thumb, uid, duration)
+def cached_meta(video_id):
+    """Catalog entry for a video whose audio file is already on disk, else None."""
+    if audio_path(video_id) is None:
+        return None
+    meta = catalog_get(video_id)
+    meta_path = os.path.join(DOWNLOAD_DIR, f"{video_id}.json")
+    if meta is None and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        catalog_put(meta)
+    return meta
+
+class PrefetchCancelled(Exception):
+    pass
+
+def fetch_audio(video_id, query, info=None, cancel=None, qos=DL_PLAYBACK):
+    """
+    Download one track with a single yt-dlp extraction. Blocking, run in
+    an executor. `info` is an already-extracted info dict to download
+    from; without it `query` is extracted and downloaded in one pass.
+    Setting the `cancel` event aborts the download at the next progress
+    update. `qos` is the download class the QoS layer throttles it as.
+    Returns the track's meta dict.
+    """
+    file = os.path.join(DOWNLOAD_DIR, f"{video_id}.m4a")
+
+    # another shard may be fetching the same id; wait for it and
+    # reuse its file instead of downloading twice
+    with QOS.job(video_id, qos, cancel) as hook, download_lock(video_id):
+        opts = dict(YDL_OPTS, progress_hooks=[hook], postprocessor_hooks=[postprocessor_spans()])
+        meta = cached_meta(video_id)
+        if meta:
+            return meta
+        if cancel is not None and cancel.is_set():
+            raise PrefetchCancelled(video_id)
+        with trace_span("download", video_id=video_id), ydl(opts) as y:
+            if info is not None:
+                info = y.process_ie_result(info, download=True)
+            else:
+                info = y.extract_info(query, download=True)
+        if "entries" in info:
+            info = info["entries"][0]
+        partial = os.path.join(PARTIAL_DIR, f"{video_id}.m4a")
+        if not os.path.exists(partial):
+            raise commands.CommandError(f"Download of {video_id} produced no m4a file.")
+        commit_file(partial, file)
+        meta = track_meta(info, query)
+        save_track_meta(meta)
+        return meta
+
+async def build_track(ctx, query, uid, info=None):
+    """
+    `info` is an info dict the caller already extracted (a search hit);
+    when given, no further extraction is needed before downloading.
+    """
+    loop = asyncio.get_event_loop()
 
-    await msg.edit(embed=ui("🎧 Processing...", f"**{title}**"))
+    if info is not None:
+        video_id = info["id"]
+    else:
+        m = re.search(r"(v=|youtu.be/)([A-Za-z0-9_-]{6,20})", query)
+        video_id = m.group(2) if m else None
 
-    def dl():
-        with YoutubeDL(YDL_OPTS) as y:
-            y.download([url])
+    if video_id:
+        meta = cached_meta(video_id)
+        if meta:
+            return track_from_meta(meta, uid)
+
+    # progress messages are cosmetic: they go out in the background and
+    # never hold up the track
+    status = StatusMessage(ctx)
+    status.update(ui("🔍 Fetching Audio...", f"**{query}**"))
+    try:
+        if video_id is None:
+            # only a bare query needs a probe to learn which id it resolves to
+            def probe():
+                with ydl(YDL_OPTS) as y:
+                    return y.extract_info(query, download=False)
+
+            with trace_span("probe"):
+                info = await run_traced(probe)
+
+            if "entries" in info:
+                info = info["entries"][0]
+            video_id = info["id"]
+
+            if audio_path(video_id):
+                meta = track_meta(info, query)
+                await loop.run_in_executor(None, save_track_meta, meta)
+                status.finish(ui("🎶 Already Cached", f"**{meta['title']}** is ready."))
+                return track_from_meta(meta, uid)
+
+        label = info.get("title", query) if info else query
+        status.update(ui("🎧 Processing...", f"**{label}**"))
+
+        meta = await run_traced(fetch_audio, video_id, query, info)
+        track = track_from_meta(meta, uid)
+
+        status.finish(ui("✅ Ready", f"**{meta['title']}**"))
+        return track
+    finally:
+        status.finish()
+
+# ========= Search prefetch =========
+# users nearly always `!play 1` or `!play 2` right after `!search`, so start
+# fetching those in the background on a single low-priority thread
+PREFETCH_TOP = 2
+PREFETCH_MAX_DURATION = 20 * 60
+prefetch_jobs = {}  # user id -> {video_id: (future, cancel event)}
+
+def _prefetch_thread_init():
+    try:
+        # per-thread on Linux; the remux ffmpeg inherits it too
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except OSError:
+        pass
 
-    await loop.run_in_executor(None, dl)
+PREFETCH_EXECUTOR = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="prefetch", initializer=_prefetch_thread_init
+)
 
-    s_meta = {
-        "id": vid,
-        "title": title,
-        "duration": duration,
-        "webpage_url": url,
-        "thumbnail": thumb
-    }
-    json.dump(s_meta, open(meta_path, "w"))
+def run_prefetch(video_id, info, cancel):
+    try:
+        fetch_audio(video_id, info.get("webpage_url"), info, cancel, qos=DL_PREFETCH)
+    except PrefetchCancelled:
+        print(f"[prefetch] cancelled {video_id}")
+    except Exception as e:
+        print(f"[prefetch] {video_id} failed: {e}")
+
+def start_prefetch(uid, results):
+    cancel_prefetch(uid)
+    jobs = {}
+    for r in results[:PREFETCH_TOP]:
+        vid = r.get("id")
+        if not vid or (r.get("duration") or 0) > PREFETCH_MAX_DURATION:
+            continue
+        if audio_path(vid):
+            continue
+        cancel = threading.Event()
+        jobs[vid] = (PREFETCH_EXECUTOR.submit(run_prefetch, vid, r, cancel), cancel)
+    prefetch_jobs[uid] = jobs
+
+def cancel_prefetch(uid, keep=None):
+    """Drop a user's speculative jobs, except the one for `keep` if given."""
+    for vid, (fut, cancel) in prefetch_jobs.pop(uid, {}).items():
+        if vid == keep:
+            # the user picked it: it now blocks playback
+            QOS.promote(vid)
+            continue
+        fut.cancel()
+        cancel.set()
+
+# ========= Listening time =========
+# Listening is recorded as intervals on the monotonic clock: one opens when
+# a guild becomes audible (playing, not paused) and closes when it stops or
+# its listeners change. Every human in the channel who isn't deafened is
+# credited. Closed intervals are appended to a fixed-size binary event log
+# and folded into hourly and daily rollups, so queries never scan the log.
+LISTEN_LOG_PATH = os.path.join(DATA_DIR, f"listening.shard{WORKER_ID}.log" if WORKER_ID else "listening.log")
+LISTEN_ROLLUP_PATH = os.path.join(DATA_DIR, f"listening.shard{WORKER_ID}.bin" if WORKER_ID else "listening.bin")
+LISTEN_RECORD = struct.Struct("<dQQf")   # start (unix time), user id, guild id, seconds
+LISTEN_ROLLUP_VERSION = 1
+LISTEN_CHECKPOINT = 60              # open intervals are cut at least this often
+LISTEN_LOG_MAX = 16 * 1024 * 1024   # rotated to .1 beyond this
+HOURLY_RETENTION = 14 * 24 * 3600
+
+class ListenLedger:
+    def __init__(self):
+        self.open = {}      # guild id -> (monotonic start, unix start, listener ids)
+        self.pending = []   # packed records not yet appended to the log
+        self.hourly = {}    # hour start -> {user id: seconds}
+        self.daily = {}     # day start (UTC) -> {user id: seconds}
+        self.offset = 0     # log bytes already folded into the rollups
+        self.load()
+
+    def load(self):
+        try:
+            with open(LISTEN_ROLLUP_PATH, "rb") as f:
+                version, self.hourly, self.daily, self.offset = marshal.load(f)
+            if version != LISTEN_ROLLUP_VERSION:
+                raise ValueError(version)
+        except:
+            self.hourly, self.daily, self.offset = {}, {}, 0
+        # records written after the last rollup snapshot
+        try:
+            with open(LISTEN_LOG_PATH, "rb") as f:
+                f.seek(self.offset)
+                data = f.read()
+        except OSError:
+            return
+        usable = len(data) - len(data) % LISTEN_RECORD.size
+        for start, uid, gid, sec in LISTEN_RECORD.iter_unpack(data[:usable]):
+            self.fold(start, uid, sec)
+        self.offset += usable
+
+    def fold(self, start, uid, sec):
+        end = start + sec
+        t = start
+        while t < end:
+            hour = int(t // 3600) * 3600
+            part = min(end, hour + 3600) - t
+            h = self.hourly.setdefault(hour, {})
+            h[uid] = h.get(uid, 0) + part
+            d = self.daily.setdefault(hour - hour % 86400, {})
+            d[uid] = d.get(uid, 0) + part
+            t += part
+
+    @staticmethod
+    def listeners(p):
+        """Humans who can hear guild `p` right now; empty while nothing is audible."""
+        v = p.voice
+        if not v or not p.current or not v.is_connected() or not v.is_playing():
+            return frozenset()
+        return frozenset(
+            m.id for m in v.channel.members
+            if not m.bot and not (m.voice and (m.voice.self_deaf or m.voice.deaf))
+        )
 
-    await msg.edit(embed=ui("✅ Ready", f"**{title}**"))
-    await asyncio.sleep(2)
-    await msg.delete()
+    def sync(self, p):
+        """Open, close or cut `p`'s interval to match what is audible now."""
+        now = time.monotonic()
+        who = self.listeners(p)
+        cur = self.open.get(p.gid)
+        if cur and cur[2] == who and now - cur[0] < LISTEN_CHECKPOINT:
+            return
+        self.close(p.gid, now)
+        if who:
+            self.open[p.gid] = (now, time.time(), who)
 
-    return Track(url, title, vid, file, thumb, uid, duration)
+    def close(self, gid, now=None):
+        cur = self.open.pop(gid, None)
+        if not cur:
+            return
+        start, wall, who = cur
+        sec = (now or time.monotonic()) - start
+        if sec <= 0:
+            return
+        for uid in who:
+            self.pending.append(LISTEN_RECORD.pack(wall, uid, gid, sec))
+            self.fold(wall, uid, sec)
+            add_user_time(uid, sec)
+        # music time is wall time played, however many were listening
+        STORED["total_play_time"] += sec
+
+    def prune(self):
+        cutoff = time.time() - HOURLY_RETENTION
+        for hour in [h for h in self.hourly if h < cutoff]:
+            del self.hourly[hour]
+
+    def take(self):
+        """Records and rollup state to flush; call on the event loop."""
+        records, self.pending = self.pending, []
+        self.prune()
+        return b"".join(records), (self.hourly, self.daily)
+
+    def flush(self, records, rollups):
+        """Blocking; appends records and snapshots the rollups."""
+        if not records:
+            return
+        with open(LISTEN_LOG_PATH, "ab") as f:
+            f.write(records)
+            f.flush()
+            os.fsync(f.fileno())
+            self.offset = f.tell()
+        if self.offset > LISTEN_LOG_MAX:
+            os.replace(LISTEN_LOG_PATH, LISTEN_LOG_PATH + ".1")
+            self.offset = 0
+        atomic_write(LISTEN_ROLLUP_PATH, marshal.dumps((LISTEN_ROLLUP_VERSION, *rollups, self.offset)))
+
+    def query(self, uid=None, period="day", since=0):
+        """{bucket start: seconds} for one user, or for everyone when uid is None."""
+        buckets = self.hourly if period == "hour" else self.daily
+        out = {}
+        for start, users in buckets.items():
+            if start >= since:
+                out[start] = users.get(uid, 0) if uid is not None else sum(users.values())
+        return out
+
+LEDGER = ListenLedger()
+boot_mark("listening")
+
+@tasks.loop(minutes=1)
+async def flush_listening():
+    for p in list(players.values()):
+        LEDGER.sync(p)
+    # marshal the rollups here, where nothing mutates them mid-dump
+    records, rollups = LEDGER.take()
+    rollups = marshal.loads(marshal.dumps(rollups))
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, LEDGER.flush, records, rollups)
+    if STATS_DIRTY["dirty"]:
+        STATS_DIRTY["dirty"] = False
+        # a private copy, so the executor never sees STORED mid-update
+        snapshot = marshal.loads(marshal.dumps(STORED))
+        await loop.run_in_executor(None, save_stats, snapshot)
+
+@flush_listening.before_loop
+async def _wait_ready12():
+    await bot.wait_until_ready()
 
 # ========= Panel Refresh & Playtime =========
 @tasks.loop(seconds=3)
 async def update_panels_and_tick_time():
+    for gid in [g for g in LEDGER.open if g not in players]:
+        LEDGER.close(gid)
     for p in players.values():
+        LEDGER.sync(p)
         if not p.voice or not p.current: continue
         if not (p.voice.is_playing() or p.voice.is_paused()): continue
 
-        add_user_time(p.current.requested_by_id, 5)
-
         if p.panel:
             try:
                 played = p.progress()
@@ -435,12 +2502,15 @@ async def update_panels_and_tick_time():
                 embed = ui(
                     "▶️ Now Playing",
                     f"**{p.current.title}**\n\n"
-                    f"Requested by <@{p.current.requested_by_id}>\n\n"
+                    f"{requested_line(p.current)}\n\n"
                     f"`{fmt_mmss(played)} / {fmt_mmss(total)}`\n"
                     f"{bar(frac)}"
                 )
                 embed.set_thumbnail(url=p.current.thumb)
-                await p.panel.edit(embed=embed)
+                panel = p.panel
+                # a newer tick's edit replaces this one if it hasn't gone out yet
+                OUTBOUND.submit(PANEL, lambda panel=panel, embed=embed: panel.edit(embed=embed),
+                                key=("edit", panel.id), ttl=3)
             except:
                 pass
 
@@ -450,13 +2520,20 @@ async def _wait_ready():
 
 @tasks.loop(hours=1)
 async def cleanup_cache():
-    cutoff = time.time() - (60 * 24 * 3600)
+    now = time.time()
+    songs = (await aggregate_stats())["songs"]
+    # the cache warmer would only download these again
+    keep = set(warm_targets(songs))
     for f in os.listdir(DOWNLOAD_DIR):
-        if f.endswith(".m4a"):
+        vid, ext = os.path.splitext(f)
+        if ext in AUDIO_EXTS and vid not in keep:
             p = os.path.join(DOWNLOAD_DIR,f)
-            if os.path.getmtime(p)<cutoff:
+            # cold opus copies are small, keep them much longer
+            max_age = CACHE_MAX_AGE if ext == ".m4a" else OPUS_MAX_AGE
+            if last_access(vid, p, songs) < now - max_age:
                 try: os.remove(p)
                 except: pass
+                catalog_remove(vid)
 
 @cleanup_cache.before_loop
 async def _wait_ready2():
@@ -464,34 +2541,496 @@ async def _wait_ready2():
 
 @tasks.loop(minutes=10)
 async def cleanup_search_cache():
+    for uid in list(prefetch_jobs):
+        cancel_prefetch(uid)
     search_results.clear()
 
 @cleanup_search_cache.before_loop
 async def _wait_ready3():
     await bot.wait_until_ready()
 
+@tasks.loop(seconds=5)
+async def journal_players():
+    records = []
+    for gid in set(players) | set(JOURNAL.written):
+        if gid in RESTORE_PENDING:
+            continue
+        p = players.get(gid)
+        state, pos = p.snapshot() if p else (None, None)
+        records += JOURNAL.diff(gid, state, pos)
+    if records:
+        await asyncio.get_event_loop().run_in_executor(None, JOURNAL.append, records)
+
+@journal_players.before_loop
+async def _wait_ready5():
+    await bot.wait_until_ready()
+
+@tasks.loop(seconds=2)
+async def flush_deletes():
+    await flush_pending_deletes()
+
+@flush_deletes.before_loop
+async def _wait_ready7():
+    await bot.wait_until_ready()
+
+@tasks.loop(minutes=5)
+async def evict_players():
+    evict_idle_players()
+
+@evict_players.before_loop
+async def _wait_ready6():
+    await bot.wait_until_ready()
+
+@tasks.loop(seconds=30)
+async def decoder_health():
+    await asyncio.get_event_loop().run_in_executor(None, DECODERS.health_check)
+
+@decoder_health.before_loop
+async def _wait_ready4():
+    await bot.wait_until_ready()
+
+@tasks.loop(seconds=2)
+async def sample_download_qos():
+    voices = sum(1 for vc in bot.voice_clients if vc.is_playing())
+    remote = 0
+    if SHARD_PROCESSES > 1:
+        # the uplink is shared: count every worker's voice streams and playback downloads
+        for d in await gather_shards("/api/shard", shard_payload):
+            if d.get("worker") != WORKER_ID:
+                voices += d.get("playing", 0)
+                remote += d.get("downloads", {}).get("playback", 0)
+    QOS.sample(voices, remote)
+
+@sample_download_qos.before_loop
+async def _wait_ready9():
+    await bot.wait_until_ready()
+
+@tasks.loop(minutes=10)
+async def colisten_upkeep():
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, COLISTEN.rebuild, COLISTEN.copy_songs(await aggregate_stats()))
+    data = COLISTEN.snapshot()
+    if data is not None:
+        await loop.run_in_executor(None, atomic_write, TRANSITIONS_PATH, data)
+
+@colisten_upkeep.before_loop
+async def _wait_ready10():
+    await bot.wait_until_ready()
+
+# ========= Cache integrity =========
+INTEGRITY_WORKERS = 2
+# scan and tiering only drive ffprobe/ffmpeg, so they run on threads: a
+# forked pool would inherit the idle decoders' stdin pipes and keep them
+# from ever seeing EOF
+NICE = ["nice", "-n", "10"]
+INTEGRITY_TAIL = 3          # seconds decoded from the end of each file
+PARTIAL_MAX_AGE = 3600      # leftover partial downloads older than this are crash debris
+
+def check_audio_file(path, expected_duration):
+    """
+    Runs on the scan thread pool. Returns None when the file looks
+    complete, otherwise a short reason.
+    """
+    try:
+        out = subprocess.run(
+            NICE + ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+             "-of", "default=nw=1:nk=1", path],
+            capture_output=True, text=True, timeout=60
+        )
+        if out.returncode != 0:
+            return f"ffprobe: {out.stderr.strip()[:200]}"
+        duration = float(out.stdout.strip() or 0)
+        if duration <= 0:
+            return "no duration"
+        if expected_duration and duration < expected_duration - 2:
+            return f"duration {duration:.0f}s, expected {expected_duration}s"
+
+        # the moov header can claim the full length of a truncated file,
+        # so actually decode the last few seconds
+        tail = subprocess.run(
+            NICE + ["ffmpeg", "-v", "error", "-xerror", "-ss", str(max(0, duration - INTEGRITY_TAIL)),
+             "-i", path, "-f", "null", "-"],
+            capture_output=True, text=True, timeout=60
+        )
+        if tail.returncode != 0:
+            return f"decode: {tail.stderr.strip()[:200]}"
+    except subprocess.TimeoutExpired:
+        return "timed out"
+    except Exception as e:
+        return str(e)
+    return None
+
+def quarantine(video_id, reason):
+    print(f"[integrity] quarantined {video_id}: {reason}")
+    catalog_remove(video_id)
+    for ext in (*AUDIO_EXTS, ".json"):
+        src = os.path.join(DOWNLOAD_DIR, video_id + ext)
+        try:
+            os.replace(src, os.path.join(QUARANTINE_DIR, video_id + ext))
+        except FileNotFoundError:
+            pass
+
+def load_verified():
+    try:
+        with open(INTEGRITY_PATH, "rb") as f:
+            return marshal.load(f)
+    except:
+        return {}
+
+def collect_scan_targets(verified):
+    """Blocking directory walk, run in a thread. Returns [(vid, path, expected, stamp)]."""
+    now = time.time()
+    for f in os.listdir(PARTIAL_DIR):
+        p = os.path.join(PARTIAL_DIR, f)
+        try:
+            if now - os.path.getmtime(p) > PARTIAL_MAX_AGE:
+                os.remove(p)
+        except OSError:
+            pass
+
+    targets = []
+    for f in os.listdir(DOWNLOAD_DIR):
+        p = os.path.join(DOWNLOAD_DIR, f)
+        if f.endswith(".json"):
+            try:
+                with open(p) as fh:
+                    json.load(fh)
+            except ValueError:
+                # the audio file may be fine; the sidecar gets rebuilt by the next probe
+                os.remove(p)
+                catalog_remove(f[:-len(".json")])
+            except OSError:
+                pass
+            continue
+        vid, ext = os.path.splitext(f)
+        if ext not in AUDIO_EXTS:
+            continue
+
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        stamp = (st.st_size, st.st_mtime)
+        if verified.get(f) == stamp:
+            continue
+        if st.st_size == 0:
+            quarantine(vid, "empty file")
+            continue
+        meta = catalog_get(vid) or {}
+        targets.append((vid, p, meta.get("duration"), stamp))
+    return targets
+
+async def integrity_scan():
+    t0 = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    verified = await loop.run_in_executor(None, load_verified)
+    targets = await loop.run_in_executor(None, collect_scan_targets, verified)
+    if not targets:
+        return
+
+    pool = ThreadPoolExecutor(max_workers=INTEGRITY_WORKERS, thread_name_prefix="integrity")
+    bad = 0
+    try:
+        results = await asyncio.gather(*(
+            loop.run_in_executor(pool, check_audio_file, path, expected)
+            for _, path, expected, _ in targets
+        ))
+    finally:
+        pool.shutdown(wait=False)
+
+    for (vid, path, _, stamp), reason in zip(targets, results):
+        if reason:
+            bad += 1
+            await loop.run_in_executor(None, quarantine, vid, reason)
+        else:
+            verified[os.path.basename(path)] = stamp
+
+    await loop.run_in_executor(None, atomic_write, INTEGRITY_PATH, marshal.dumps(verified))
+    print(f"[integrity] checked {len(targets)} files, {bad} quarantined in {time.perf_counter() - t0:.1f}s")
+
+# ========= Storage tiering =========
+# Tracks that are rarely played and haven't been touched for a while are
+# transcoded to low-bitrate opus so far more of the library fits on the SD
+# card; popular tracks stay full-quality m4a. Plays and last-play times
+# come from the stats, the file mtime stands in for tracks never played.
+CACHE_MAX_AGE = 60 * 24 * 3600
+OPUS_MAX_AGE = 365 * 24 * 3600
+TIER_COLD_AFTER = 14 * 24 * 3600
+TIER_HOT_PLAYS = 5
+TIER_BATCH = 50
+TIER_WORKERS = 1
+OPUS_BITRATE = "48k"
+
+def last_access(video_id, path, songs):
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = 0
+    return max(mtime, songs.get(video_id, {}).get("last_played", 0))
+
+def cold_candidates(songs):
+    """m4a tracks due for the opus tier, coldest first."""
+    now = time.time()
+    found = []
+    for f in os.listdir(DOWNLOAD_DIR):
+        vid, ext = os.path.splitext(f)
+        if ext != ".m4a":
+            continue
+        song = songs.get(vid, {})
+        if song.get("plays", 0) >= TIER_HOT_PLAYS:
+            continue
+        last = last_access(vid, os.path.join(DOWNLOAD_DIR, f), songs)
+        if now - last > TIER_COLD_AFTER:
+            found.append((last, vid))
+    found.sort()
+    return [vid for _, vid in found[:TIER_BATCH]]
+
+def transcode_cold(video_id):
+    """Runs on the tiering thread pool. Returns bytes saved (0 if skipped)."""
+    src = os.path.join(DOWNLOAD_DIR, f"{video_id}.m4a")
+    dst = os.path.join(DOWNLOAD_DIR, f"{video_id}.opus")
+    tmp = os.path.join(PARTIAL_DIR, f"{video_id}.opus")
+    with download_lock(video_id):
+        if not os.path.exists(src) or os.path.exists(dst):
+            return 0
+        r = subprocess.run(
+            NICE + ["ffmpeg", "-v", "error", "-y", "-i", src, "-vn",
+             "-c:a", "libopus", "-b:a", OPUS_BITRATE, "-application", "audio", tmp],
+            capture_output=True, timeout=1800
+        )
+        meta = catalog_get(video_id) or {}
+        if r.returncode != 0 or check_audio_file(tmp, meta.get("duration")):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return 0
+        saved = os.path.getsize(src) - os.path.getsize(tmp)
+        commit_file(tmp, dst)
+        # players with the m4a open keep reading it; new ones follow track_file()
+        os.remove(src)
+        return saved
+
+@tasks.loop(hours=6)
+async def storage_tiering():
+    loop = asyncio.get_event_loop()
+    vids = await loop.run_in_executor(None, cold_candidates, (await aggregate_stats())["songs"])
+    if not vids:
+        return
+
+    pool = ThreadPoolExecutor(max_workers=TIER_WORKERS, thread_name_prefix="tiering")
+    try:
+        saved = await asyncio.gather(
+            *(loop.run_in_executor(pool, transcode_cold, vid) for vid in vids),
+            return_exceptions=True
+        )
+    finally:
+        pool.shutdown(wait=False)
+
+    done = [s for s in saved if isinstance(s, int) and s > 0]
+    print(f"[tiering] {len(done)}/{len(vids)} tracks moved to opus, {_format_bytes(sum(done))} freed")
+
+@storage_tiering.before_loop
+async def _wait_ready8():
+    await bot.wait_until_ready()
+    # let the startup integrity scan have the CPU first
+    await asyncio.sleep(600)
+
+# ========= Cache warming =========
+# The most played tracks, and whatever is trending this week, are kept on
+# disk so nobody waits on a download for them after cleanup_cache expired
+# them. Downloads run as the background QoS class, only while the host is
+# idle, and stop at a per-run byte cap or the cache disk budget.
+WARM_TOP = 50
+WARM_TRENDING = 20
+TRENDING_WINDOW = 7 * 24 * 3600
+WARM_BYTES_PER_RUN = int(os.getenv("WARM_BYTES_PER_RUN", 200 * 1024 * 1024))
+CACHE_DISK_BUDGET = int(os.getenv("CACHE_DISK_BUDGET", 8 * 1024 * 1024 * 1024))
+WARM_MIN_FREE = 1024 * 1024 * 1024
+WARM_IDLE_RX = 0.1          # share of NET_DOWN_CAPACITY above which the host isn't idle
+WARM_RETRY_AFTER = 24 * 3600
+warm_failed = {}            # video id -> time of the last failed warm
+
+def warm_targets(songs):
+    """Video ids the warmer keeps on disk: top played, then trending."""
+    top = sorted(songs, key=lambda v: songs[v].get("plays", 0), reverse=True)[:WARM_TOP]
+    cutoff = time.time() - TRENDING_WINDOW
+    recent = [v for v in songs if songs[v].get("last_played", 0) > cutoff]
+    recent.sort(key=lambda v: songs[v].get("plays", 0), reverse=True)
+    targets = dict.fromkeys(top)
+    targets.update(dict.fromkeys(recent[:WARM_TRENDING]))
+    return list(targets)
+
+def cache_size():
+    total = 0
+    for f in os.listdir(DOWNLOAD_DIR):
+        if os.path.splitext(f)[1] in AUDIO_EXTS:
+            try:
+                total += os.path.getsize(os.path.join(DOWNLOAD_DIR, f))
+            except OSError:
+                pass
+    return total
+
+async def host_idle():
+    """No voice streaming and no playback/prefetch download on any worker of this host."""
+    if SHARD_PROCESSES > 1:
+        shards = await gather_shards("/api/shard", shard_payload)
+    else:
+        shards = [shard_payload()]
+    for d in shards:
+        downloads = d.get("downloads", {})
+        # an unreachable worker may well be busy
+        if "error" in d or d.get("playing") or downloads.get("playback") or downloads.get("prefetch"):
+            return False
+    return QOS.rx_rate < NET_DOWN_CAPACITY * WARM_IDLE_RX
+
+def warm_budget_left(used):
+    if used >= WARM_BYTES_PER_RUN:
+        return False
+    if shutil.disk_usage(DOWNLOAD_DIR).free < WARM_MIN_FREE:
+        return False
+    return cache_size() < CACHE_DISK_BUDGET
+
+@tasks.loop(minutes=15)
+async def warm_cache():
+    if not await host_idle():
+        return
+    loop = asyncio.get_event_loop()
+    now = time.time()
+    missing = [
+        vid for vid in warm_targets((await aggregate_stats())["songs"])
+        if not audio_path(vid) and now - warm_failed.get(vid, 0) > WARM_RETRY_AFTER
+    ]
+
+    used = fetched = 0
+    for vid in missing:
+        if not await host_idle() or not await loop.run_in_executor(None, warm_budget_left, used):
+            break
+        url = f"https://www.youtube.com/watch?v={vid}"
+        try:
+            await loop.run_in_executor(None, lambda: fetch_audio(vid, url, qos=DL_BACKGROUND))
+        except Exception as e:
+            warm_failed[vid] = now
+            print(f"[warm] {vid} failed: {e}")
+            continue
+        path = audio_path(vid)
+        used += os.path.getsize(path) if path else 0
+        fetched += 1
+
+    if fetched:
+        print(f"[warm] restored {fetched}/{len(missing)} popular tracks, {_format_bytes(used)}")
+
+@warm_cache.before_loop
+async def _wait_ready11():
+    await bot.wait_until_ready()
+
 # ========= Events =========
 @bot.event
 async def on_ready():
     print("Logged in as", bot.user)
+    if not any(phase == "gateway" for phase, _, _ in BOOT_TIMES):
+        boot_mark("gateway")
+        breakdown = ", ".join(f"{phase} {dt:.2f}s" for phase, dt, _ in BOOT_TIMES)
+        print(f"[boot] ready in {BOOT_TIMES[-1][2] - BOOT_T0:.2f}s ({breakdown})")
+        # one scanner per host, in the background so it never delays readiness
+        if WORKER_ID == 0:
+            spawn_bg(integrity_scan())
+            storage_tiering.start()
+            warm_cache.start()
+        spawn_bg(restore_sessions())
+        journal_players.start()
+        evict_players.start()
+        flush_deletes.start()
+        flush_listening.start()
     update_panels_and_tick_time.start()
     cleanup_search_cache.start()
+    decoder_health.start()
+    sample_download_qos.start()
+    colisten_upkeep.start()
     await start_api()
     cleanup_cache.start()
-    await bot.change_presence(activity=discord.Activity(type=discord.ActivityType.listening, name="YouTube Music"))
+    set_presence("YouTube Music")
+
+# ========= Voice channel index =========
+# Only channels the bot sits in are tracked, and their human counts are
+# kept up to date from each event's before/after instead of rescanning
+# every player's member list.
+IDLE_DISCONNECT_GRACE = 60
+
+voice_index = {}    # voice channel id -> guild id
+human_counts = {}   # voice channel id -> non-bot members
+idle_timers = {}    # voice channel id -> pending disconnect task
+
+def count_humans(channel):
+    return sum(1 for m in channel.members if not m.bot)
+
+def index_channel(channel):
+    voice_index[channel.id] = channel.guild.id
+    human_counts[channel.id] = count_humans(channel)
+    check_idle(channel)
+
+def unindex_channel(channel_id):
+    voice_index.pop(channel_id, None)
+    human_counts.pop(channel_id, None)
+    timer = idle_timers.pop(channel_id, None)
+    if timer:
+        timer.cancel()
+
+def check_idle(channel):
+    if human_counts.get(channel.id) == 0:
+        if channel.id not in idle_timers:
+            idle_timers[channel.id] = spawn_bg(idle_disconnect(channel))
+    else:
+        timer = idle_timers.pop(channel.id, None)
+        if timer:
+            timer.cancel()
+
+async def idle_disconnect(channel):
+    await asyncio.sleep(IDLE_DISCONNECT_GRACE)
+    # drop ourselves first: the disconnect below unindexes the channel,
+    # which would otherwise cancel this task halfway through
+    idle_timers.pop(channel.id, None)
+
+    # recount once in case an event was missed while we waited
+    humans = count_humans(channel)
+    if humans:
+        human_counts[channel.id] = humans
+        return
+
+    gid = voice_index.get(channel.id, channel.guild.id)
+    vc = channel.guild.voice_client
+    if vc:
+        await vc.disconnect()
+    players.pop(gid, None)
 
 @bot.event
 async def on_voice_state_update(member, before, after):
-    for p in list(players.values()):
-        if not p.voice or not p.voice.is_connected():
-            continue
+    before_id = before.channel.id if before.channel else None
+    after_id = after.channel.id if after.channel else None
+    if before_id == after_id:
+        return  # mute / deafen / stream toggles
+
+    if member.id == bot.user.id:
+        if before_id:
+            unindex_channel(before_id)
+        if after.channel:
+            index_channel(after.channel)
+        return
 
-        vc = p.voice.channel
-        real_users = [m for m in vc.members if not m.bot]
+    if member.bot:
+        return
 
-        if len(real_users) == 0:
-            await p.voice.disconnect()
-            players.pop(p.gid, None)
+    if before_id in human_counts:
+        human_counts[before_id] -= 1
+        check_idle(before.channel)
+    if after_id in human_counts:
+        human_counts[after_id] += 1
+        check_idle(after.channel)
+    # listeners changed: cut the interval so each is credited exactly
+    for cid in (before_id, after_id):
+        p = players.get(voice_index.get(cid))
+        if p:
+            LEDGER.sync(p)
 
 @bot.listen("on_message")
 async def warn_uppercase_commands(msg: discord.Message):
@@ -507,10 +3046,10 @@ async def warn_uppercase_commands(msg: discord.Message):
         return
 
     if cmd.lower() != cmd:
-        await msg.channel.send(
+        await OUTBOUND.call(INTERACTIVE, lambda: msg.channel.send(
             embed=ui("⚠️ Lowercase Commands Only", f"Use: `!{cmd.lower()}`"),
             delete_after=8
-        )
+        ))
 
 def parse_spotify_track(url: str):
     """
@@ -539,6 +3078,12 @@ async def help(ctx):
 !repeatall / !ra
 !pause / !pa
 !resume / !re
+!crossfade / !cf
+!seek <m:ss>
+!forward / !fw [sec]
+!rewind / !rw [sec]
+!quiet
+!autoplay / !ap
 
 **Voice**
 !leave / !d
@@ -549,77 +3094,114 @@ async def help(ctx):
 !stats
 !leaderboard / !lb
 """
-    await ctx.send(embed=ui("📘 Music Bot Commands", cmds))
+    await reply(ctx, embed=ui("📘 Music Bot Commands", cmds))
 
 @bot.command()
 async def search(ctx,*,query):
-    await ctx.send(embed=ui("🔍 Searching…",f"**{query}**"))
-    with YoutubeDL({"quiet":True}) as y:
-        info = y.extract_info(f"ytsearch5:{query}",download=False)
+    await reply(ctx, embed=ui("🔍 Searching…",f"**{query}**"))
+
+    def find():
+        with ydl({"quiet":True}) as y:
+            return y.extract_info(f"ytsearch5:{query}",download=False)
+
+    info = await asyncio.get_event_loop().run_in_executor(None, find)
     results = info.get("entries",[])
     if not results:
-        return await ctx.send(embed=ui("⚠️ Not found"))
+        return await reply(ctx, embed=ui("⚠️ Not found"))
+    # full info dicts, so `!play N` can build the track without extracting again
     search_results[ctx.author.id] = results
+    start_prefetch(ctx.author.id, results)
     text = "\n".join([f"**{i+1}.** {r['title']}" for i,r in enumerate(results)])
-    await ctx.send(embed=ui("🎶 Results", text+"\n\nUse `!play 1` to select."))
+    await reply(ctx, embed=ui("🎶 Results", text+"\n\nUse `!play 1` to select."))
 
 @bot.command()
 async def play(ctx,*,query):
+    trace = Trace(
+        "play", started=ctx.message.created_at.timestamp(),
+        guild=ctx.guild.id, user=ctx.author.id, query=query
+    )
+    # message sent -> command running
+    trace.close(trace.begin("dispatch", start=0.0))
+    token = CURRENT_TRACE.set(trace)
+    try:
+        await play_request(ctx, query)
+    except Exception as e:
+        if trace.end is None:
+            trace.attrs["error"] = str(e)
+            trace.status = "error"
+        raise
+    finally:
+        CURRENT_TRACE.reset(token)
+        # no-op if the first packet already closed it
+        trace.finish()
+
+async def play_request(ctx, query):
     p = getp(ctx.guild)
     p.play_id +=1
     my_play_id = p.play_id
     if not ctx.voice_client:
         if not ctx.author.voice:
-            return await ctx.send(embed=ui("⚠️ Join voice first"))
-        p.voice = await ctx.author.voice.channel.connect(self_deaf=True)
+            return await reply(ctx, embed=ui("⚠️ Join voice first"))
+        with trace_span("voice_connect"):
+            p.voice = await ctx.author.voice.channel.connect(self_deaf=True)
     else:
         p.voice = ctx.voice_client
+    p.text_channel_id = ctx.channel.id
+
+    # a search hit is already fully extracted; hand it to build_track
+    # so the track is not extracted a second time
+    hit = None
 
     if query.isdigit() and ctx.author.id in search_results:
         i = int(query)-1
         arr = search_results[ctx.author.id]
         if 0 <= i < len(arr):
-            query = arr[i]["webpage_url"]
+            hit = arr[i]
+            query = hit["webpage_url"]
+            cancel_prefetch(ctx.author.id, keep=hit.get("id"))
 
     if "open.spotify.com/track" in query:
         track_id = parse_spotify_track(query)
 
         if not track_id:
-            return await ctx.send(embed=ui("⚠️ Invalid Spotify link"))
+            return await reply(ctx, embed=ui("⚠️ Invalid Spotify link"))
 
-        with YoutubeDL({"quiet": True}) as y:
+        with trace_span("spotify"), ydl({"quiet": True}) as y:
             info = y.extract_info(
                 f"ytsearch1:{track_id}",
                 download=False
             )
 
         if not info.get("entries"):
-            return await ctx.send(embed=ui("⚠️ Track not found on YouTube"))
+            return await reply(ctx, embed=ui("⚠️ Track not found on YouTube"))
 
-        query = info["entries"][0]["webpage_url"]
+        hit = info["entries"][0]
+        query = hit["webpage_url"]
 
     if not YOUTUBE_URL_RE.search(query):
-        with YoutubeDL({"quiet":True}) as y:
+        with trace_span("search"), ydl({"quiet":True}) as y:
             info = y.extract_info(f"ytsearch1:{query}",download=False)
-        query = info["entries"][0]["webpage_url"]
+        hit = info["entries"][0]
+        query = hit["webpage_url"]
     if "list=RD" in query:
         parsed = urllib.parse.urlparse(query)
         qs = urllib.parse.parse_qs(parsed.query)
         if "v" in qs:
             video_id = qs["v"][0]
             query = f"https://www.youtube.com/watch?v={video_id}"
-            await ctx.send(embed=ui("⚠️ Mix/Radio Auto-Fixed",
+            await reply(ctx, embed=ui("⚠️ Mix/Radio Auto-Fixed",
                 "You provided a YouTube Mix/Radio link.\n\nUsing the main video instead."),
             delete_after=8
             )
         else:
-            return await ctx.send(embed=ui(
+            return await reply(ctx, embed=ui(
                 "🚫 Unsupported Link",
                 "YouTube Mix/Radio playlists cannot be played.\nProvide a normal YouTube video URL."
             ),
             delete_after=8
             )
-    track = await build_track(ctx, query, ctx.author.id)
+    with trace_span("build_track"):
+        track = await build_track(ctx, query, ctx.author.id, info=hit)
     if my_play_id != p.play_id:
         return
     track.play_id = my_play_id
@@ -628,7 +3210,8 @@ async def play(ctx,*,query):
         await p.loop(ctx)
     else:
         position = len(p.queue)
-        await ctx.send(embed=ui("➕ Added to Queue", f"**{track.title}**\nPosition: `{position}`"))
+        CURRENT_TRACE.get().status = "queued"
+        await reply(ctx, embed=ui("➕ Added to Queue", f"**{track.title}**\nPosition: `{position}`"))
 
 @bot.command(name="p")
 async def alias_p(ctx,*,query):
@@ -636,8 +3219,8 @@ async def alias_p(ctx,*,query):
 
 @bot.command()
 async def next(ctx):
-    p = getp(ctx.guild)
-    if p.voice: p.voice.stop()
+    p = peekp(ctx.guild)
+    if p and p.voice: p.voice.stop()
 
 @bot.command(name="n")
 async def alias_n(ctx):
@@ -645,17 +3228,19 @@ async def alias_n(ctx):
 
 @bot.command()
 async def prev(ctx):
-    p = getp(ctx.guild)
-    if len(p.history) >= 2:
+    p = peekp(ctx.guild)
+    if p and len(p.history) >= 2:
         last = p.history.pop()
         p.queue.insert(0,last)
         if p.voice: p.voice.stop()
     else:
-        await ctx.send(embed=ui("ℹ️ No previous track."))
+        await reply(ctx, embed=ui("ℹ️ No previous track."))
 
 @bot.command()
 async def stop(ctx):
-    p = getp(ctx.guild)
+    p = peekp(ctx.guild)
+    if not p:
+        return await reply(ctx, embed=ui("🛑 Stopped", "Queue cleared."))
 
     p.play_id += 1
 
@@ -665,12 +3250,14 @@ async def stop(ctx):
 
     if p.voice:
         p.voice.stop()
+    p.engine = None
     p.current = None
     p.start_t = None
     p.pause_t = None
     p.paused_accum = 0
+    LEDGER.sync(p)
 
-    await ctx.send(embed=ui("🛑 Stopped", "Queue cleared."))
+    await reply(ctx, embed=ui("🛑 Stopped", "Queue cleared."))
 
 @bot.command(name="s")
 async def alias_s(ctx):
@@ -680,7 +3267,7 @@ async def alias_s(ctx):
 async def repeat(ctx):
     p = getp(ctx.guild)
     p.repeat_mode = 1 if p.repeat_mode!=1 else 0
-    await ctx.send(embed=ui("🔁 Repeat One", f"**{'ON' if p.repeat_mode==1 else 'OFF'}**"))
+    await reply(ctx, embed=ui("🔁 Repeat One", f"**{'ON' if p.repeat_mode==1 else 'OFF'}**"))
 
 @bot.command(name="r")
 async def alias_r(ctx):
@@ -690,7 +3277,7 @@ async def alias_r(ctx):
 async def repeatall(ctx):
     p = getp(ctx.guild)
     p.repeat_mode = 2 if p.repeat_mode!=2 else 0
-    await ctx.send(embed=ui("🔂 Repeat All", f"**{'ON' if p.repeat_mode==2 else 'OFF'}**"))
+    await reply(ctx, embed=ui("🔂 Repeat All", f"**{'ON' if p.repeat_mode==2 else 'OFF'}**"))
 
 @bot.command(name="ra")
 async def alias_ra(ctx):
@@ -698,24 +3285,27 @@ async def alias_ra(ctx):
 
 @bot.command(name="leave")
 async def leave(ctx):
-    p = getp(ctx.guild)
+    p = peekp(ctx.guild)
 
-    if p.current and p.voice:
-        p.last_paused_track = p.current
-        p.last_paused_position = p.progress()
+    if not p:
+        if ctx.voice_client:
+            await ctx.voice_client.disconnect(force=True)
     else:
-        p.last_paused_track = None
-        p.last_paused_position = 0
+        if p.current and p.voice:
+            p.last_paused_track = p.current
+            p.last_paused_position = p.progress()
+        else:
+            p.last_paused_track = None
+            p.last_paused_position = 0
 
-    if p.voice:
-        await p.voice.disconnect(force=True)
+        if p.voice:
+            await p.voice.disconnect(force=True)
 
-    p.voice = None
-    p.panel = None
+        p.voice = None
+        p.panel = None
 
-    await ctx.send(embed=ui("👋 Left Voice"))
-    await bot.change_presence(activity=discord.Activity(
-        type=discord.ActivityType.listening, name="YouTube Music"))
+    await reply(ctx, embed=ui("👋 Left Voice"))
+    set_presence("YouTube Music")
 
 @bot.command(name="d")
 async def alias_d(ctx):
@@ -723,28 +3313,26 @@ async def alias_d(ctx):
 
 @bot.command()
 async def queue(ctx):
-    p = getp(ctx.guild)
-    if not p.queue:
-        return await ctx.send(embed=ui("📜 Queue", "Empty."))
+    p = peekp(ctx.guild)
+    if not p or not p.queue:
+        return await reply(ctx, embed=ui("📜 Queue", "Empty."))
 
     text = ""
     for i, t in enumerate(p.queue, start=1):
         text += f"**{i}.** {t.title}\n"
 
     embed = ui("📜 Queue", text[:2000])
-    await ctx.send(embed=embed)
+    await reply(ctx, embed=embed)
 
 @bot.command(name="np", aliases=["now", "nowplay"])
 async def now_playing(ctx):
-    p = getp(ctx.guild)
-    if not p.current:
-        return await ctx.send(embed=ui("⏹️ Idle", "Nothing is playing."))
+    p = peekp(ctx.guild)
+    if not p or not p.current:
+        return await reply(ctx, embed=ui("⏹️ Idle", "Nothing is playing."))
 
     if p.panel:
-        try:
-            await p.panel.delete()
-        except:
-            pass
+        OUTBOUND.submit(BACKGROUND, p.panel.delete)
+        p.panel = None
 
     played = p.progress()
     total = p.current.duration or 0
@@ -752,41 +3340,45 @@ async def now_playing(ctx):
     embed = ui(
         "▶️ Now Playing",
         f"**{p.current.title}**\n"
-        f"Requested by <@{p.current.requested_by_id}>\n\n"
+        f"{requested_line(p.current)}\n\n"
         f"`{fmt_mmss(played)} / {fmt_mmss(total)}`\n"
         f"{bar(frac)}"
         )
     embed.set_thumbnail(url=p.current.thumb)
 
-    p.panel = await ctx.send(embed=embed)
+    p.panel = await reply(ctx, embed=embed)
 
 @bot.command(name="pause", aliases=["pa"])
 async def pause_cmd(ctx):
-    p = getp(ctx.guild)
+    p = peekp(ctx.guild)
 
-    if not p.voice or not p.voice.is_connected():
-        return await ctx.send(embed=ui("⚠️ Not connected"))
+    if not p or not p.voice or not p.voice.is_connected():
+        return await reply(ctx, embed=ui("⚠️ Not connected"))
 
     if not p.current:
-        return await ctx.send(embed=ui("⚠️ Nothing is playing."))
+        return await reply(ctx, embed=ui("⚠️ Nothing is playing."))
 
     if p.voice.is_paused():
-        return await ctx.send(embed=ui("⏸️ Already Paused"))
+        return await reply(ctx, embed=ui("⏸️ Already Paused"))
 
     p.voice.pause()
     p.pause_t = time.time()
     p.last_paused_track = p.current
     p.last_paused_position = p.progress()
+    LEDGER.sync(p)
 
-    await ctx.send(embed=ui("⏸️ Paused", f"**{p.current.title}**"))
+    await reply(ctx, embed=ui("⏸️ Paused", f"**{p.current.title}**"))
 
 @bot.command(name="resume", aliases=["re"])
 async def resume_cmd(ctx):
-    p = getp(ctx.guild)
+    p = peekp(ctx.guild)
+    if not p:
+        return await reply(ctx, embed=ui("⚠️ Nothing to resume."))
+    p.last_active = time.monotonic()
 
     if not p.voice or not p.voice.is_connected():
         if not ctx.author.voice:
-            return await ctx.send(embed=ui("⚠️ Join a voice channel first."))
+            return await reply(ctx, embed=ui("⚠️ Join a voice channel first."))
 
         p.voice = await ctx.author.voice.channel.connect(self_deaf=True)
 
@@ -794,29 +3386,80 @@ async def resume_cmd(ctx):
             t = p.last_paused_track
             pos = p.last_paused_position
 
-            source = discord.FFmpegPCMAudio(
-                t.file,
-                before_options=f"-ss {int(pos)}",
-                options="-vn"
-            )
-
-            p.voice.play(source)
+            p.engine = GaplessSource(t, open_source(t, pos), pos)
+            p.voice.play(p.engine)
             p.start_t = time.time() - pos
             p.pause_t = None
 
             p.current = t
-            return await ctx.send(embed=ui("▶️ Resumed", f"**{t.title}**"))
+            LEDGER.sync(p)
+            return await reply(ctx, embed=ui("▶️ Resumed", f"**{t.title}**"))
 
-        return await ctx.send(embed=ui("⚠️ Nothing to resume."))
+        return await reply(ctx, embed=ui("⚠️ Nothing to resume."))
 
     if not p.voice.is_paused():
-        return await ctx.send(embed=ui("⚠️ Not paused."))
+        return await reply(ctx, embed=ui("⚠️ Not paused."))
 
     p.paused_accum += time.time() - p.pause_t
     p.pause_t = None
     p.voice.resume()
+    LEDGER.sync(p)
 
-    await ctx.send(embed=ui("▶️ Resumed", f"**{p.current.title}**"))
+    await reply(ctx, embed=ui("▶️ Resumed", f"**{p.current.title}**"))
+
+def parse_timestamp(text):
+    """'83', '1:23' or '1:01:23' -> seconds."""
+    try:
+        secs = 0
+        for part in text.split(":"):
+            secs = secs * 60 + float(part)
+        return secs
+    except ValueError:
+        raise commands.BadArgument(f"Invalid time `{text}`, use `m:ss` or seconds.")
+
+async def seek_and_report(ctx, pos=None, delta=0):
+    p = peekp(ctx.guild)
+    if not p:
+        raise commands.CommandError("Nothing is playing.")
+    pos = await p.seek(p.progress() + delta if pos is None else pos)
+    total = p.current.duration or 0
+    await reply(ctx, embed=ui("⏩ Seeked", f"**{p.current.title}**\n`{fmt_mmss(pos) if pos else '00:00'} / {fmt_mmss(total)}`"))
+
+@bot.command(name="seek")
+async def seek_cmd(ctx, position: str):
+    await seek_and_report(ctx, pos=parse_timestamp(position))
+
+@bot.command(name="forward", aliases=["fw"])
+async def forward_cmd(ctx, seconds: int = 10):
+    await seek_and_report(ctx, delta=seconds)
+
+@bot.command(name="rewind", aliases=["rw"])
+async def rewind_cmd(ctx, seconds: int = 10):
+    await seek_and_report(ctx, delta=-seconds)
+
+@bot.command(name="quiet")
+async def quiet_cmd(ctx):
+    quiet = not guild_setting(ctx.guild.id, "quiet", False)
+    await asyncio.get_event_loop().run_in_executor(None, set_guild_setting, ctx.guild.id, "quiet", quiet)
+    state = "**ON** (no fetch/progress messages)" if quiet else "**OFF**"
+    await reply(ctx, embed=ui("🤫 Quiet Mode", state))
+
+@bot.command(name="autoplay", aliases=["ap"])
+async def autoplay_cmd(ctx):
+    autoplay = not guild_setting(ctx.guild.id, "autoplay", False)
+    await asyncio.get_event_loop().run_in_executor(None, set_guild_setting, ctx.guild.id, "autoplay", autoplay)
+    state = "**ON** (related cached tracks play when the queue runs out)" if autoplay else "**OFF**"
+    await reply(ctx, embed=ui("🔁 Autoplay", state))
+
+@bot.command(name="crossfade", aliases=["cf"])
+async def crossfade_cmd(ctx, seconds: Optional[int] = None):
+    p = getp(ctx.guild)
+
+    if seconds is not None:
+        p.crossfade = max(0, min(MAX_CROSSFADE, seconds))
+
+    state = f"**{p.crossfade}s**" if p.crossfade else "**OFF** (gapless)"
+    await reply(ctx, embed=ui("🎚️ Crossfade", state))
 
 # ========= Stats =========
 @bot.command()
@@ -825,26 +3468,28 @@ async def server(ctx):
     total,used,free = get_mem()
     l1,l5,l15 = get_load()
     temp = get_temp()
+    stored = await aggregate_stats()
     desc = (
         f"Uptime: **{fmt_time(up)}**\n"
         f"RAM: **{total/1e9:.2f} GB total**, **{used/1e9:.2f} GB used**, **{free/1e9:.2f} GB free**\n"
         f"Load avg: **{l1:.2f} {l5:.2f} {l15:.2f}**\n"
         f"CPU Temp: **{temp:.1f}°C**\n"
-        f"Music time: **{fmt_time(STORED['total_play_time'])}**\n"
-        f"Songs played: **{STORED['total_songs']}**"
+        f"Music time: **{fmt_time(stored['total_play_time'])}**\n"
+        f"Songs played: **{stored['total_songs']}**"
     )
-    await ctx.send(embed=ui("🖥️ Server", desc))
+    await reply(ctx, embed=ui("🖥️ Server", desc))
 
 @bot.command()
 async def stats(ctx, user: Optional[discord.Member]=None):
     user = user or ctx.author
     uid = str(user.id)
 
-    u = STORED["users"].get(uid, {"time": 0, "songs": 0})
+    stored = await aggregate_stats()
+    u = stored["users"].get(uid, {"time": 0, "songs": 0})
 
     # Count unique songs listened by this user
     unique_song_count = 0
-    for vid, data in STORED.get("songs", {}).items():
+    for vid, data in stored.get("songs", {}).items():
         if user.id in data.get("users", []):
             unique_song_count += 1
 
@@ -855,14 +3500,15 @@ async def stats(ctx, user: Optional[discord.Member]=None):
         f"Songs requested: **{u['songs']}**"
     )
 
-    await ctx.send(embed=ui("📈 Stats", desc))
+    await reply(ctx, embed=ui("📈 Stats", desc))
 
 @bot.command(name="leaderboard", aliases=["lb"])
 async def leaderboard_cmd(ctx):
+    stored = await aggregate_stats()
     # Top Users by time listened
     users = [
         (int(uid), data.get("time", 0.0), data.get("songs", 0))
-        for uid, data in STORED.get("users", {}).items()
+        for uid, data in stored.get("users", {}).items()
     ]
 
     users_sorted = sorted(users, key=lambda x: x[1], reverse=True)[:10]
@@ -870,7 +3516,7 @@ async def leaderboard_cmd(ctx):
     user_lines = []
     for i, (uid, sec, songs) in enumerate(users_sorted, 1):
         try:
-            user = await bot.fetch_user(uid)
+            user = bot.get_user(uid) or await OUTBOUND.call(INTERACTIVE, lambda uid=uid: bot.fetch_user(uid))
             name = user.name
         except:
             name = f"UnknownUser({uid})"
@@ -881,7 +3527,7 @@ async def leaderboard_cmd(ctx):
 
     # Top Songs by **unique listeners**
     songs = []
-    for vid, data in STORED.get("songs", {}).items():
+    for vid, data in stored.get("songs", {}).items():
         title = data.get("title", "Unknown")
         unique_users = len(data.get("users", []))
         songs.append((vid, title, unique_users))
@@ -896,12 +3542,12 @@ async def leaderboard_cmd(ctx):
     desc = "**Top Users (Time Listened):**\n" + ("\n".join(user_lines) or "_no data_")
     desc += "\n\n**Top Songs (Unique Listeners):**\n" + ("\n".join(song_lines) or "_no data_")
 
-    await ctx.send(embed=ui("🏆 Leaderboard", desc))
+    await reply(ctx, embed=ui("🏆 Leaderboard", desc))
 
 @bot.command()
 async def ping(ctx):
     embed = ui("🏓 Pong!", "Running ping & speed test… please wait ⏳")
-    msg = await ctx.send(embed=embed)
+    msg = await reply(ctx, embed=embed)
 
     try:
         # no more speedtest-cli
@@ -949,7 +3595,7 @@ async def ping(ctx):
             color=0x00FF00
         )
 
-        await msg.edit(embed=final_embed)
+        await OUTBOUND.call(INTERACTIVE, lambda: msg.edit(embed=final_embed))
 
     except Exception as e:
         err_embed = ui(
@@ -957,7 +3603,7 @@ async def ping(ctx):
             f"```{str(e)}```",
             color=0xFF0000
         )
-        await msg.edit(embed=err_embed)
+        await OUTBOUND.call(INTERACTIVE, lambda: msg.edit(embed=err_embed))
 
 # ========= Errors =========
 @bot.event
@@ -965,55 +3611,184 @@ async def on_command_error(ctx, error):
     if isinstance(error, commands.CommandNotFound):
         return
     try:
-        await ctx.send(embed=ui("⚠️ Error", str(error)))
+        await reply(ctx, embed=ui("⚠️ Error", str(error)))
     except:
         pass
 
+def nowplaying_payload():
+    if not players:
+        return {
+        "status": "Nothing playing",
+        "icon": "🎵"
+      }
+
+    p = list(players.values())[0]
+
+    if not p.current:
+        return {
+        "status": "Nothing playing",
+        "icon": "🎵"
+      }
+
+    if p.voice and p.voice.is_paused():
+        state = "paused"
+        icon = "⏸️"
+    elif p.voice and p.voice.is_playing():
+        state = "playing"
+        icon = "▶️"
+    else:
+        state = "Nothing playing"
+        icon = "🎵"
+
+    played = p.progress()
+    total = p.current.duration or 0
+    frac = played / total if total else 0
+
+    return {
+        "status": state,
+        "icon": icon,
+        "title": p.current.title,
+        "video_id": p.current.video_id,
+        "thumbnail": p.current.thumb,
+        "requested_by": p.current.requested_by_id,
+        "played": played,
+        "duration": total,
+        "progress": frac
+    }
+
+def shard_payload():
+    return {
+        "worker": WORKER_ID,
+        "shard_ids": bot.shard_ids or list(range(bot.shard_count or 1)),
+        "guilds": len(bot.guilds),
+        "players": len(players),
+        "playing": sum(1 for p in players.values() if p.voice and p.voice.is_playing()),
+        "downloads": QOS.stats()["active"],
+        "latency": bot.latency
+    }
+
+def shard_api_port(worker):
+    return API_PORT + 1 + worker
+
+async def gather_shards(path, local):
+    """
+    Ask every shard worker's internal API for `path`.
+    This worker answers from `local()` directly instead of over HTTP.
+    """
+    timeout = aiohttp.ClientTimeout(total=2)
+
+    async def one(session, worker):
+        if worker == WORKER_ID:
+            data = local()
+        else:
+            try:
+                url = f"http://127.0.0.1:{shard_api_port(worker)}{path}"
+                async with session.get(url) as r:
+                    data = await r.json()
+            except Exception as e:
+                data = {"error": str(e)}
+        data["worker"] = worker
+        return data
+
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        return await asyncio.gather(*(one(session, w) for w in range(SHARD_PROCESSES)))
+
+async def api_local_nowplaying(request):
+    try:
+        return web.json_response(nowplaying_payload())
+    except Exception as e:
+        return web.json_response({"error": str(e)})
+
+async def api_local_shard(request):
+    return web.json_response(shard_payload())
+
 async def api_nowplaying(request):
     try:
-        if not players:
-            return web.json_response({
-            "status": "Nothing playing",
-            "icon": "🎵"
-          })
-
-        p = list(players.values())[0]
-
-        if not p.current:
-            return web.json_response({
-            "status": "Nothing playing",
-            "icon": "🎵"
-          })
-
-        if p.voice and p.voice.is_paused():
-            state = "paused"
-            icon = "⏸️"
-        elif p.voice and p.voice.is_playing():
-            state = "playing"
-            icon = "▶️"
-        else:
-            state = "Nothing playing"
-            icon = "🎵"
-
-        played = p.progress()
-        total = p.current.duration or 0
-        frac = played / total if total else 0
-
-        return web.json_response({
-            "status": state,
-            "icon": icon,
-            "title": p.current.title,
-            "video_id": p.current.video_id,
-            "thumbnail": p.current.thumb,
-            "requested_by": p.current.requested_by_id,
-            "played": played,
-            "duration": total,
-            "progress": frac
-        })
+        if SHARD_PROCESSES <= 1:
+            return web.json_response(nowplaying_payload())
+
+        shards = await gather_shards("/api/np", nowplaying_payload)
+        active = [d for d in shards if d.get("title")]
+        payload = dict(active[0]) if active else {"status": "Nothing playing", "icon": "🎵"}
+        payload["shards"] = shards
+        return web.json_response(payload)
 
     except Exception as e:
         return web.json_response({"error": str(e)})
 
+def traces_payload(slow=False):
+    traces = [t.summary() for t in reversed(TRACES) if not slow or _ms(t.end) >= TRACE_SLOW_MS]
+    return {"traces": traces}
+
+async def api_local_traces(request):
+    return web.json_response(traces_payload(request.query.get("slow") == "1"))
+
+async def api_traces(request):
+    slow = request.query.get("slow") == "1"
+    if SHARD_PROCESSES <= 1:
+        return web.json_response(traces_payload(slow))
+    shards = await gather_shards("/api/traces" + ("?slow=1" if slow else ""), lambda: traces_payload(slow))
+    traces = [t for d in shards for t in d.get("traces", [])]
+    traces.sort(key=lambda t: t["started"], reverse=True)
+    return web.json_response({"traces": traces})
+
+async def api_trace(request):
+    tid = request.match_info["id"]
+    worker = tid.split("-")[0]
+    if SHARD_PROCESSES > 1 and worker.isdigit() and int(worker) != WORKER_ID:
+        # the trace lives in the ring buffer of the worker that served it
+        try:
+            url = f"http://127.0.0.1:{shard_api_port(int(worker))}/api/traces/{tid}"
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=2)) as session:
+                async with session.get(url) as r:
+                    return web.json_response(await r.json(), status=r.status)
+        except Exception as e:
+            return web.json_response({"error": str(e)}, status=502)
+    for t in TRACES:
+        if t.id == tid:
+            return web.json_response(t.to_dict())
+    return web.json_response({"error": "unknown trace"}, status=404)
+
+def listening_payload(query):
+    uid = query.get("user")
+    period = "hour" if query.get("period") == "hour" else "day"
+    days = float(query.get("days", 7))
+    buckets = LEDGER.query(int(uid) if uid else None, period, time.time() - days * 86400)
+    return {"period": period, "buckets": {str(k): round(v, 1) for k, v in sorted(buckets.items())}}
+
+async def api_local_listening(request):
+    try:
+        return web.json_response(listening_payload(request.query))
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+
+async def api_listening(request):
+    """Listening seconds per hour or day: ?user=<id>&period=hour|day&days=7"""
+    try:
+        if SHARD_PROCESSES <= 1:
+            return web.json_response(listening_payload(request.query))
+        shards = await gather_shards(f"/api/listening?{request.query_string}", lambda: listening_payload(request.query))
+        merged = {}
+        for d in shards:
+            for k, v in d.get("buckets", {}).items():
+                merged[k] = round(merged.get(k, 0) + v, 1)
+        return web.json_response({"period": shards[0].get("period"), "buckets": dict(sorted(merged.items()))})
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+
+async def api_local_memory(request):
+    return web.json_response(memory_report())
+
+async def api_memory(request):
+    if SHARD_PROCESSES <= 1:
+        return web.json_response(memory_report())
+    return web.json_response(await gather_shards("/api/memory", memory_report))
+
+async def api_shards(request):
+    if SHARD_PROCESSES <= 1:
+        return web.json_response([shard_payload()])
+    return web.json_response(await gather_shards("/api/shard", shard_payload))
+
 
 async def api_status(request):
     up = get_uptime_sec()
@@ -1033,7 +3808,11 @@ async def api_status(request):
             "5m": l5,
             "15m": l15
         },
-        "cpu_temp": temp
+        "cpu_temp": temp,
+        "decoders": DECODERS.stats(),
+        "outbound": OUTBOUND.stats(),
+        "downloads": QOS.stats(),
+        "startup": {phase: round(dt, 3) for phase, dt, _ in BOOT_TIMES}
     })
 
 
@@ -1090,10 +3869,31 @@ async def api_net(request):
     return web.json_response(await get_network_stats())
 
 async def start_api():
+    # every worker serves its own state on a loopback port; worker 0 also
+    # owns the public port and fans requests out to the others
+    if SHARD_PROCESSES > 1:
+        internal = web.Application()
+        internal.router.add_get("/api/np", api_local_nowplaying)
+        internal.router.add_get("/api/shard", api_local_shard)
+        internal.router.add_get("/api/memory", api_local_memory)
+        internal.router.add_get("/api/traces", api_local_traces)
+        internal.router.add_get("/api/listening", api_local_listening)
+        internal.router.add_get("/api/traces/{id}", api_trace)
+        runner = web.AppRunner(internal)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", shard_api_port(WORKER_ID)).start()
+        if WORKER_ID != 0:
+            return
+
     app = web.Application()
     app.router.add_get("/api/np", api_nowplaying)
     app.router.add_get("/api/stats", api_status)
     app.router.add_get("/api/net", api_net)
+    app.router.add_get("/api/shards", api_shards)
+    app.router.add_get("/api/memory", api_memory)
+    app.router.add_get("/api/traces", api_traces)
+    app.router.add_get("/api/listening", api_listening)
+    app.router.add_get("/api/traces/{id}", api_trace)
 
     runner = web.AppRunner(app)
     await runner.setup()
@@ -1102,4 +3902,11 @@ async def start_api():
     print(f"[API] Running on http://0.0.0.0:{API_PORT}")
 
 # ========= Run =========
+boot_mark("setup")
 bot.run(TOKEN)
+
+# the client has shut down: bank intervals that were still open
+for gid in list(LEDGER.open):
+    LEDGER.close(gid)
+LEDGER.flush(*LEDGER.take())
+save_stats(STORED)